@@ -0,0 +1,157 @@
+import asyncio
+from collections import deque
+from logging import getLogger
+from time import monotonic
+from time import perf_counter
+
+from fastapi import Request
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+import settings
+from deadline import bounded_timeout
+from deadline import DeadlineExceeded
+
+logger = getLogger(__name__)
+
+# routes that hold a database connection, service endpoints stay reachable
+# while the workers shed load
+ADMISSION_PATH_PREFIXES = ("/user", "/login")
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded wait queue, adjusted by AIMD.
+
+    The limit grows by one for every limit's worth of responses faster than
+    the latency target and is multiplied by `backoff` when a response is
+    slower or reports overload, at most once per target window.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        latency_target_ms: float,
+        backoff: float,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target_ms = latency_target_ms
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters = deque()
+        self._decreased_at = float("-inf")
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self):
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise AdmissionRejected("Server is overloaded, try again later")
+        try:
+            timeout = bounded_timeout(self.queue_timeout)
+        except DeadlineExceeded as err:
+            self.shed += 1
+            raise AdmissionRejected("Request deadline exceeded") from err
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as err:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over just as the wait ended
+                self._free_slot()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(err, asyncio.TimeoutError):
+                self.shed += 1
+                raise AdmissionRejected("Server is overloaded, try again later")
+            raise
+        self.admitted += 1
+
+    def release(self, latency_ms: float, overloaded: bool = False):
+        if overloaded or latency_ms > self.latency_target_ms:
+            now = monotonic()
+            if now - self._decreased_at >= self.latency_target_ms / 1000:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._decreased_at = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._free_slot()
+
+    def _free_slot(self):
+        self.in_flight -= 1
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.ADMISSION_CONTROL,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+        }
+
+
+admission_controller = AdmissionController(
+    initial_limit=settings.ADMISSION_INITIAL_LIMIT,
+    min_limit=settings.ADMISSION_MIN_LIMIT,
+    max_limit=settings.ADMISSION_MAX_LIMIT,
+    max_queue=settings.ADMISSION_QUEUE_SIZE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    latency_target_ms=settings.ADMISSION_LATENCY_TARGET_MS,
+    backoff=settings.ADMISSION_BACKOFF,
+)
+
+
+async def admission_middleware(request: Request, call_next):
+    if not settings.ADMISSION_CONTROL or not request.url.path.startswith(
+        ADMISSION_PATH_PREFIXES
+    ):
+        return await call_next(request)
+    try:
+        await admission_controller.acquire()
+    except AdmissionRejected as err:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": str(err)},
+            headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)},
+        )
+    started_at = perf_counter()
+    overloaded = False
+    try:
+        response = await call_next(request)
+        overloaded = response.status_code in (
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            status.HTTP_504_GATEWAY_TIMEOUT,
+        )
+        return response
+    finally:
+        admission_controller.release(
+            (perf_counter() - started_at) * 1000, overloaded=overloaded
+        )
@@ -1,20 +1,30 @@
+from datetime import datetime
 from logging import getLogger
+from typing import Optional
 from typing import Union
+from uuid import UUID
 
 from fastapi import APIRouter
+from fastapi import BackgroundTasks
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt
-from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-import settings
+from db.crud import RevokedTokenCRUD
 from db.crud import UserCRUD
+from db.models import Principal
 from db.models import User
 from db.session import get_db
+from hashing import async_hasher
 from hashing import Hasher
+from revocation import revocation_list
+from security import ACCESS_TOKEN_TYPE
+from security import decode_token
+from security import invalidate_token
+from security import InvalidTokenError
+from security import REFRESH_TOKEN_TYPE
 
 logger = getLogger(__name__)
 
@@ -29,14 +39,100 @@ async def _get_user_by_email(email: str, db_session: AsyncSession):
         return await user_crud.get_user_by_email(email=email)
 
 
+async def _get_security_version(user_id: UUID, db_session: AsyncSession):
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        return await user_crud.get_security_version(user_id=user_id)
+
+
+async def _warm_up_principal_cache(emails: list[str], db_session: AsyncSession):
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        return await user_crud.get_users_by_emails(emails=emails)
+
+
+async def _rehash_password(user_id: UUID, password: str, db_session: AsyncSession):
+    try:
+        hashed_password = await async_hasher.hash(password)
+        async with db_session.begin():
+            user_crud = UserCRUD(db_session)
+            await user_crud.update_password_hash(user_id, hashed_password)
+    except Exception as err:
+        # the old hash keeps working, so a failed rehash is retried next login
+        logger.warning(f"Couldn't rehash password for user {user_id}: {err}")
+
+
 async def authenticate_user(
-    email: str, password: str, db_session: AsyncSession
+    email: str,
+    password: str,
+    db_session: AsyncSession,
+    background_tasks: Optional[BackgroundTasks] = None,
 ) -> Union[User, None]:
-    user = await _get_user_by_email(email=email, db=db_session)
+    user = await _get_user_by_email(email=email, db_session=db_session)
     if user is None:
         return
-    if not Hasher.verify_password(password, user.hashed_password):
+    if not await async_hasher.verify(password, user.hashed_password):
         return
+    # rewrite hashes made with an outdated cost once the response is sent
+    if background_tasks is not None and Hasher.needs_update(user.hashed_password):
+        background_tasks.add_task(_rehash_password, user.user_id, password, db_session)
+    return user
+
+
+async def _is_token_revoked(payload: dict, db_session: AsyncSession) -> bool:
+    jti = payload.get("jti")
+    # the Bloom filter answers most checks without touching the database
+    if jti is None or not revocation_list.might_be_revoked(jti):
+        return False
+    async with db_session.begin():
+        return await RevokedTokenCRUD(db_session).is_token_revoked(jti)
+
+
+async def _revoke_tokens(payloads: list[dict], db_session: AsyncSession) -> list[str]:
+    revoked_jtis = []
+    async with db_session.begin():
+        revoked_token_crud = RevokedTokenCRUD(db_session)
+        for payload in payloads:
+            await revoked_token_crud.revoke_token(
+                jti=payload["jti"], expires_at=datetime.utcfromtimestamp(payload["exp"])
+            )
+            revoked_jtis.append(payload["jti"])
+    for jti in revoked_jtis:
+        revocation_list.add(jti)
+    return revoked_jtis
+
+
+async def _decode_valid_token(
+    token: str, token_type: str, db_session: AsyncSession
+) -> dict:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Couldn't validate credentials",
+    )
+    try:
+        payload = decode_token(token)
+    except InvalidTokenError:
+        raise credentials_exception
+    if payload.get("sub") is None:
+        raise credentials_exception
+    if payload.get("type", ACCESS_TOKEN_TYPE) != token_type:
+        raise credentials_exception
+    if await _is_token_revoked(payload, db_session):
+        invalidate_token(token)
+        raise credentials_exception
+    return payload
+
+
+async def _get_user_from_refresh_token(
+    refresh_token: str, db_session: AsyncSession
+) -> User:
+    payload = await _decode_valid_token(refresh_token, REFRESH_TOKEN_TYPE, db_session)
+    user = await _get_user_by_email(email=payload["sub"], db_session=db_session)
+    if user is None or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Couldn't validate credentials",
+        )
     return user
 
 
@@ -44,19 +140,26 @@ async def authenticate_user(
 
 
 async def get_current_user_from_token(
-    token: str = Depends(oauth2_scheme), db_session: AsyncSession = Depends(get_db)
+    token: str = Depends(oauth2_scheme),
+    # primary, not the replica: a lagging replica would re-cache roles or a
+    # security version that a demotion or deactivation already replaced
+    db_session: AsyncSession = Depends(get_db),
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Couldn't validate credentials",
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, [settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    payload = await _decode_valid_token(token, ACCESS_TOKEN_TYPE, db_session)
+    email: str = payload["sub"]
+    if "uid" in payload:
+        # self-contained token: reject it if roles changed since it was issued
+        principal = Principal.from_claims(payload)
+        security_version = await _get_security_version(
+            user_id=principal.user_id, db_session=db_session
+        )
+        if security_version != principal.security_version:
             raise credentials_exception
-    except JWTError:
-        credentials_exception
+        return principal
     user = await _get_user_by_email(email=email, db_session=db_session)
     if user is None:
         raise credentials_exception
@@ -1,16 +1,46 @@
+import csv
+import io
+import json
+from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64encode
+from enum import Enum
 from logging import getLogger
+from typing import AsyncIterator
+from typing import Optional
 from typing import Union
 from uuid import UUID
+from uuid import uuid4
 
 from fastapi import APIRouter
 from fastapi import HTTPException
+from fastapi import Response
+from sqlalchemy import and_
+from sqlalchemy import false
+from sqlalchemy import func
+from sqlalchemy import not_
+from sqlalchemy import or_
+from sqlalchemy import true
+from sqlalchemy.engine import Row
 
+import settings
 from api.schemas import CreateUser
+from api.schemas import CreateUserResult
+from api.schemas import CreateUsersResponse
+from api.schemas import GetUsersResponse
+from api.schemas import ListUsersResponse
 from api.schemas import ShowUser
+from api.schemas import UpsertUserResponse
+from api.schemas import UpsertUsersResponse
 from db.crud import User
 from db.crud import UserCRUD
+from db.models import ADMIN_BIT
+from db.models import has_any_role
+from db.models import PRIVILEGED_ROLES_MASK
+from db.models import SUPERADMIN_BIT
 from db.models import UserRole
-from hashing import Hasher
+from db.session import CONSISTENCY_TOKEN_HEADER
+from db.session import get_consistency_token
+from hashing import async_hasher
 
 logger = getLogger(__name__)
 
@@ -22,13 +52,15 @@ user_router = APIRouter()
 
 
 async def _create_new_user(body: CreateUser, db_session) -> ShowUser:
+    # hash before opening the transaction so no connection is held meanwhile
+    hashed_password = await async_hasher.hash(body.password)
     async with db_session.begin():
         user_crud = UserCRUD(db_session)
         user = await user_crud.create_user(  # SQLAlchemy object
             name=body.name,
             surname=body.surname,
             email=body.email,
-            hashed_password=Hasher.set_password_hashed(body.password),
+            hashed_password=hashed_password,
             roles=[
                 UserRole.ROLE_USER_SIMPLE,
             ],
@@ -42,6 +74,88 @@ async def _create_new_user(body: CreateUser, db_session) -> ShowUser:
         )
 
 
+async def _create_new_users(
+    bodies: list[CreateUser], db_session
+) -> CreateUsersResponse:
+    hashed_passwords = await async_hasher.hash_many([body.password for body in bodies])
+    users = [
+        {
+            "user_id": uuid4(),
+            "name": body.name,
+            "surname": body.surname,
+            "email": body.email,
+            "is_active": True,
+            "hashed_password": hashed_password,
+            "roles": [UserRole.ROLE_USER_SIMPLE],
+        }
+        for body, hashed_password in zip(bodies, hashed_passwords)
+    ]
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        created_rows = await user_crud.create_users(users)
+    created_by_id = {row.user_id: row for row in created_rows}
+    results = []
+    for user in users:
+        row = created_by_id.get(user["user_id"])
+        if row is None:
+            results.append(CreateUserResult(email=user["email"], status="conflict"))
+        else:
+            results.append(
+                CreateUserResult(
+                    email=row.email, status="created", user=ShowUser.from_orm(row)
+                )
+            )
+    return CreateUsersResponse(
+        created=len(created_rows),
+        conflicts=len(users) - len(created_rows),
+        results=results,
+    )
+
+
+async def _upsert_users(bodies: list[CreateUser], db_session) -> UpsertUsersResponse:
+    # one hash per row, used by the insert or the update alike
+    hashed_passwords = await async_hasher.hash_many([body.password for body in bodies])
+    users = [
+        {
+            "user_id": uuid4(),
+            "name": body.name,
+            "surname": body.surname,
+            "email": body.email,
+            "is_active": True,
+            "hashed_password": hashed_password,
+            "roles": [UserRole.ROLE_USER_SIMPLE],
+        }
+        for body, hashed_password in zip(bodies, hashed_passwords)
+    ]
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        rows = await user_crud.upsert_users(
+            users, condition=not_(has_any_role(PRIVILEGED_ROLES_MASK))
+        )
+    rows_by_email = {row.email.lower(): row for row in rows}
+    upserted, skipped = [], []
+    for user in users:
+        row = rows_by_email.get(user["email"].lower())
+        if row is None:
+            skipped.append(user["email"])
+        else:
+            upserted.append(UpsertUserResponse.from_orm(row))
+    created = sum(user.created for user in upserted)
+    return UpsertUsersResponse(
+        created=created,
+        updated=len(upserted) - created,
+        users=upserted,
+        skipped=skipped,
+    )
+
+
+async def _set_consistency_token(response: Response, db_session):
+    async with db_session.begin():
+        consistency_token = await get_consistency_token(db_session)
+    if consistency_token is not None:
+        response.headers[CONSISTENCY_TOKEN_HEADER] = consistency_token
+
+
 async def _get_user_by_id(user_id, db_session) -> Union[User, None]:
     async with db_session.begin():
         user_crud = UserCRUD(db_session)
@@ -50,44 +164,279 @@ async def _get_user_by_id(user_id, db_session) -> Union[User, None]:
             return user
 
 
-async def _delete_user(user_id, db_session) -> Union[UUID, None]:
+def user_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_etags(header: str, weak: bool) -> Optional[list[int]]:
+    """Versions listed in an If-Match/If-None-Match header, None for "*".
+
+    Weak tags only count when `weak` comparison is allowed (If-None-Match),
+    tags that aren't ours never match.
+    """
+    if header.strip() == "*":
+        return None
+    versions = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
+
+
+async def _get_users_by_ids(user_ids: list[UUID], db_session) -> GetUsersResponse:
+    # duplicates are resolved once, the order of first appearance is kept
+    user_ids = list(dict.fromkeys(user_ids))
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        users = await user_crud.get_users_by_ids(user_ids=user_ids)
+    users_by_id = {user.user_id: user for user in users}
+    return GetUsersResponse(
+        users=[
+            ShowUser.from_orm(users_by_id[user_id])
+            for user_id in user_ids
+            if user_id in users_by_id
+        ],
+        missing_ids=[user_id for user_id in user_ids if user_id not in users_by_id],
+    )
+
+
+class UserListOrder(str, Enum):
+    USER_ID = "user_id"
+    EMAIL = "email"
+
+
+def _encode_cursor(*keys) -> str:
+    return urlsafe_b64encode(json.dumps(keys).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        keys = json.loads(urlsafe_b64decode(cursor.encode()))
+    except ValueError as err:
+        raise HTTPException(status_code=422, detail=f"Invalid cursor: {err}")
+    if not isinstance(keys, list):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    return keys
+
+
+def _decode_list_cursor(order_by: UserListOrder, cursor: str) -> Union[UUID, str]:
+    try:
+        cursor_order_by, last_key = _decode_cursor(cursor)
+        if cursor_order_by != order_by.value:
+            raise ValueError("cursor was issued for another order")
+        if order_by == UserListOrder.USER_ID:
+            return UUID(last_key)
+        return str(last_key)
+    except (ValueError, TypeError) as err:
+        raise HTTPException(status_code=422, detail=f"Invalid cursor: {err}")
+
+
+async def _list_users(
+    order_by: UserListOrder,
+    cursor: Optional[str],
+    limit: int,
+    is_active: Optional[bool],
+    role: Optional[UserRole],
+    db_session,
+) -> ListUsersResponse:
+    after = _decode_list_cursor(order_by, cursor) if cursor is not None else None
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        # one extra row tells whether there is a next page
+        users = await user_crud.list_users(
+            order_by=order_by.value,
+            after=after,
+            limit=limit + 1,
+            is_active=is_active,
+            role=role,
+        )
+    next_cursor = (
+        _encode_cursor(order_by.value, str(getattr(users[limit - 1], order_by.value)))
+        if len(users) > limit
+        else None
+    )
+    return ListUsersResponse(
+        users=[ShowUser.from_orm(user) for user in users[:limit]],
+        next_cursor=next_cursor,
+    )
+
+
+async def _search_users(
+    query: str, cursor: Optional[str], limit: int, db_session
+) -> ListUsersResponse:
+    after = None
+    if cursor is not None:
+        try:
+            last_rank, last_user_id = _decode_cursor(cursor)
+            after = (float(last_rank), UUID(last_user_id))
+        except (ValueError, TypeError) as err:
+            raise HTTPException(status_code=422, detail=f"Invalid cursor: {err}")
     async with db_session.begin():
         user_crud = UserCRUD(db_session)
-        deleted_user_id = await user_crud.delete_user(user_id=user_id)
-        return deleted_user_id
+        rows = await user_crud.search_users(query=query, after=after, limit=limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        last_user, last_rank = rows[limit - 1]
+        next_cursor = _encode_cursor(last_rank, str(last_user.user_id))
+    return ListUsersResponse(
+        users=[ShowUser.from_orm(user) for user, _ in rows[:limit]],
+        next_cursor=next_cursor,
+    )
+
+
+class UserExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+USER_EXPORT_MEDIA_TYPES = {
+    UserExportFormat.NDJSON: "application/x-ndjson",
+    UserExportFormat.CSV: "text/csv",
+}
 
+USER_EXPORT_COLUMNS = ("user_id", "name", "surname", "email", "is_active", "roles")
 
-async def _update_user(
-    user_params_to_update: dict, user_id: UUID, db_session
-) -> Union[UUID, None]:
+
+def _rows_to_ndjson(rows) -> str:
+    return "".join(
+        json.dumps({**row._asdict(), "user_id": str(row.user_id)}) + "\n"
+        for row in rows
+    )
+
+
+def _rows_to_csv(rows, header: bool = False) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(USER_EXPORT_COLUMNS)
+    writer.writerows(
+        (
+            row.user_id,
+            row.name,
+            row.surname,
+            row.email,
+            row.is_active,
+            "|".join(row.roles),
+        )
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+async def _export_users(
+    export_format: UserExportFormat, db_session
+) -> AsyncIterator[str]:
+    # the transaction stays open while the response streams, one chunk is
+    # fetched only after the previous one has been sent to the client
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        if export_format == UserExportFormat.CSV:
+            yield _rows_to_csv([], header=True)
+        async for rows in user_crud.stream_users(
+            chunk_size=settings.USER_EXPORT_CHUNK_SIZE
+        ):
+            if export_format == UserExportFormat.CSV:
+                yield _rows_to_csv(rows)
+            else:
+                yield _rows_to_ndjson(rows)
+
+
+async def _delete_user_if(
+    user_id: UUID, condition, db_session, versions: Optional[list[int]] = None
+) -> Union[Row, None]:
     async with db_session.begin():
         user_crud = UserCRUD(db_session)
-        updated_user_id = await user_crud.update_user(user_id, **user_params_to_update)
-        return updated_user_id
+        return await user_crud.delete_user_if(
+            user_id=user_id, condition=condition, versions=versions
+        )
+
+
+async def _update_user_if(
+    user_params_to_update: dict,
+    user_id: UUID,
+    condition,
+    db_session,
+    versions: Optional[list[int]] = None,
+) -> Union[Row, None]:
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        return await user_crud.update_user_if(
+            user_id, condition, versions=versions, **user_params_to_update
+        )
+
+
+async def _grant_admin_privilege(user_id: UUID, db_session) -> Union[Row, None]:
+    return await _update_user_if(
+        user_params_to_update={
+            "roles": func.array_append(User.roles, UserRole.ROLE_USER_ADMIN)
+        },
+        user_id=user_id,
+        condition=not_(has_any_role(PRIVILEGED_ROLES_MASK)),
+        db_session=db_session,
+    )
+
+
+async def _revoke_admin_privilege(
+    user_id: UUID, current_user: User, db_session
+) -> Union[Row, None]:
+    return await _update_user_if(
+        user_params_to_update={
+            "roles": func.array_remove(User.roles, UserRole.ROLE_USER_ADMIN)
+        },
+        user_id=user_id,
+        condition=and_(
+            has_any_role(ADMIN_BIT),
+            User.user_id != current_user.user_id,
+        ),
+        db_session=db_session,
+    )
 
 
 def check_user_permissions(target_user: User, current_user: User) -> bool:
-    if UserRole.ROLE_USER_SUPERADMIN in current_user.roles:
+    if current_user.role_mask & SUPERADMIN_BIT:
         raise HTTPException(
             status_code=406, detail="Superadmin can't be deleted via API"
         )
     if target_user.user_id != current_user.user_id:
         # if user has admin permissions
-        if not {
-            UserRole.ROLE_USER_ADMIN,
-            UserRole.ROLE_USER_SUPERADMIN,
-        }.intersection(current_user.roles):
+        if not current_user.role_mask & PRIVILEGED_ROLES_MASK:
             return False
         # if user as admin attempts to delete superadmin
         if (
-            UserRole.ROLE_USER_SUPERADMIN in target_user.roles
-            and UserRole.ROLE_USER_ADMIN in current_user.roles
+            target_user.role_mask & SUPERADMIN_BIT
+            and current_user.role_mask & ADMIN_BIT
         ):
             return False
         # if user has superadmin permissions
-        if (
-            UserRole.ROLE_USER_ADMIN in target_user.roles
-            and UserRole.ROLE_USER_ADMIN in current_user.roles
-        ):
+        if target_user.role_mask & ADMIN_BIT and current_user.role_mask & ADMIN_BIT:
             return False
     return True
+
+
+def user_permission_clause(current_user: User):
+    """SQL twin of check_user_permissions, evaluated against the target row.
+
+    A superadmin gets a false clause; check_user_permissions raises the 406
+    once the statement has shown that the target exists.
+    """
+    if current_user.role_mask & SUPERADMIN_BIT:
+        return false()
+    is_current_user = User.user_id == current_user.user_id
+    if not current_user.role_mask & ADMIN_BIT:
+        return is_current_user
+    return or_(is_current_user, not_(has_any_role(PRIVILEGED_ROLES_MASK)))
+
+
+def update_permission_clause(user_id: UUID, current_user: User):
+    # mirrors the update route: users may always update themselves, anyone
+    # else is rejected when check_user_permissions passes for them
+    if user_id == current_user.user_id:
+        return true()
+    if current_user.is_superadmin:
+        return false()
+    return not_(user_permission_clause(current_user))
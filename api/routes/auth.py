@@ -2,6 +2,7 @@ from datetime import timedelta
 from logging import getLogger
 
 from fastapi import APIRouter
+from fastapi import BackgroundTasks
 from fastapi import Depends
 from fastapi import HTTPException
 from fastapi import status
@@ -10,10 +11,22 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import settings
+from api.handlers.auth import _decode_valid_token
+from api.handlers.auth import _get_user_from_refresh_token
+from api.handlers.auth import _revoke_tokens
 from api.handlers.auth import authenticate_user
+from api.handlers.auth import get_current_user_from_token
+from api.schemas import RefreshTokenRequest
+from api.schemas import RevokeTokenRequest
+from api.schemas import RevokeTokenResponse
 from api.schemas import Token
+from db.models import User
 from db.session import get_db
+from security import ACCESS_TOKEN_TYPE
+from security import build_access_token_claims
 from security import create_access_token
+from security import create_refresh_token
+from security import REFRESH_TOKEN_TYPE
 
 logger = getLogger(__name__)
 
@@ -24,10 +37,13 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login/token")
 
 @login_router.post("/token", response_model=Token)
 async def login_for_access_token(
+    background_tasks: BackgroundTasks,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db_session: AsyncSession = Depends(get_db),
 ):
-    user = await authenticate_user(form_data.username, form_data.password, db_session)
+    user = await authenticate_user(
+        form_data.username, form_data.password, db_session, background_tasks
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -35,7 +51,50 @@ async def login_for_access_token(
         )
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email, "other_custom_data": [1, 2, 3, 4]},
+        data=build_access_token_claims(user),
+        expires_delta=access_token_expires,
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": create_refresh_token(user.email),
+        "token_type": "bearer",
+    }
+
+
+@login_router.post("/refresh", response_model=Token)
+async def refresh_access_token(
+    body: RefreshTokenRequest, db_session: AsyncSession = Depends(get_db)
+):
+    # no password verification here, the refresh token is the credential
+    user = await _get_user_from_refresh_token(body.refresh_token, db_session)
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data=build_access_token_claims(user),
         expires_delta=access_token_expires,
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {
+        "access_token": access_token,
+        "refresh_token": body.refresh_token,
+        "token_type": "bearer",
+    }
+
+
+@login_router.post("/revoke", response_model=RevokeTokenResponse)
+async def revoke_tokens(
+    body: RevokeTokenRequest,
+    token: str = Depends(oauth2_scheme),
+    db_session: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> RevokeTokenResponse:
+    payloads = [await _decode_valid_token(token, ACCESS_TOKEN_TYPE, db_session)]
+    if body.refresh_token is not None:
+        refresh_payload = await _decode_valid_token(
+            body.refresh_token, REFRESH_TOKEN_TYPE, db_session
+        )
+        if refresh_payload["sub"] != current_user.email:
+            raise HTTPException(status_code=403, detail="Forbidden.")
+        payloads.append(refresh_payload)
+    # tokens issued before ids were added can only expire
+    payloads = [payload for payload in payloads if "jti" in payload]
+    revoked_jtis = await _revoke_tokens(payloads, db_session)
+    return RevokeTokenResponse(revoked_jtis=revoked_jtis)
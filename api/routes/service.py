@@ -0,0 +1,40 @@
+from logging import getLogger
+
+from fastapi import APIRouter
+
+from admission import admission_controller
+from archiver import archive_stats
+from db.crud import principal_cache
+from db.crud import user_loader
+from db.session import get_pool_stats
+from db.session import replica_router
+from deadline import deadline_stats
+from hashing import async_hasher
+from lifespan import startup_report
+from revocation import revocation_list
+from security import token_cache
+
+logger = getLogger(__name__)
+
+service_router = APIRouter()
+
+#############################################
+# Endpoints for service metrics #
+############################################
+
+
+@service_router.get("/metrics")
+async def get_metrics() -> dict:
+    return {
+        "db_pool": get_pool_stats(),
+        "admission": admission_controller.stats(),
+        "replica": replica_router.stats(),
+        "deadlines": deadline_stats,
+        "hashing": async_hasher.stats(),
+        "token_cache": token_cache.stats(),
+        "principal_cache": principal_cache.stats(),
+        "user_loader": user_loader.stats(),
+        "revocation_list": revocation_list.stats(),
+        "user_archive": archive_stats,
+        "startup": startup_report,
+    }
@@ -1,28 +1,70 @@
 from logging import getLogger
+from typing import Optional
 from uuid import UUID
 
 from fastapi import APIRouter
 from fastapi import Depends
+from fastapi import Header
 from fastapi import HTTPException
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+import settings
 from api.handlers.auth import get_current_user_from_token
 from api.handlers.user import _create_new_user
-from api.handlers.user import _delete_user
+from api.handlers.user import _create_new_users
+from api.handlers.user import _delete_user_if
+from api.handlers.user import _export_users
 from api.handlers.user import _get_user_by_id
-from api.handlers.user import _update_user
+from api.handlers.user import _get_users_by_ids
+from api.handlers.user import _grant_admin_privilege
+from api.handlers.user import _list_users
+from api.handlers.user import _revoke_admin_privilege
+from api.handlers.user import _search_users
+from api.handlers.user import _set_consistency_token
+from api.handlers.user import _update_user_if
+from api.handlers.user import _upsert_users
 from api.handlers.user import check_user_permissions
+from api.handlers.user import parse_etags
+from api.handlers.user import update_permission_clause
+from api.handlers.user import user_etag
+from api.handlers.user import USER_EXPORT_MEDIA_TYPES
+from api.handlers.user import user_permission_clause
+from api.handlers.user import UserExportFormat
+from api.handlers.user import UserListOrder
 from api.schemas import CreateUser
+from api.schemas import CreateUsersResponse
 from api.schemas import DeleteUserResponse
+from api.schemas import GetUsersRequest
+from api.schemas import GetUsersResponse
+from api.schemas import ImportReject
+from api.schemas import ImportUsersResponse
+from api.schemas import ListUsersResponse
 from api.schemas import ShowUser
 from api.schemas import UpdateUserRequest
 from api.schemas import UpdateUserResponse
+from api.schemas import UpsertUserResponse
+from api.schemas import UpsertUsersResponse
+from archiver import is_user_archived
+from archiver import restore_user
+from db.models import ADMIN_BIT
+from db.models import PRIVILEGED_ROLES_MASK
 from db.models import User
+from db.models import UserRole
 from db.session import get_db
+from db.session import get_db_read
+from importer import import_users
+from importer import ImportFormat
+from importer import iter_lines
 
 logger = getLogger(__name__)
 
+USER_MODIFIED_DETAIL = "User was modified meanwhile, fetch it again and retry"
+
 user_router = APIRouter()
 
 #############################################
@@ -32,44 +74,159 @@ user_router = APIRouter()
 
 @user_router.post("/", response_model=ShowUser)
 async def create_user(
-    body: CreateUser, db_session: AsyncSession = Depends(get_db)
+    body: CreateUser, response: Response, db_session: AsyncSession = Depends(get_db)
 ) -> ShowUser:
     try:
-        return await _create_new_user(body, db_session)
+        new_user = await _create_new_user(body, db_session)
+    except IntegrityError as err:
+        logger.error(err)
+        raise HTTPException(status_code=503, detail=f"Database error: {err}")
+    await _set_consistency_token(response, db_session)
+    return new_user
+
+
+@user_router.post("/batch", response_model=CreateUsersResponse)
+async def create_users(
+    bodies: list[CreateUser],
+    response: Response,
+    db_session: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> CreateUsersResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    if not bodies:
+        raise HTTPException(status_code=422, detail="No users to create")
+    if len(bodies) > settings.USER_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.USER_BATCH_MAX_SIZE} users per request",
+        )
+    result = await _create_new_users(bodies, db_session)
+    await _set_consistency_token(response, db_session)
+    return result
+
+
+@user_router.put("/", response_model=UpsertUserResponse)
+async def upsert_user(
+    body: CreateUser,
+    response: Response,
+    db_session: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> UpsertUserResponse:
+    """Create the user or update the account with this email, in one statement."""
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    try:
+        result = await _upsert_users([body], db_session)
     except IntegrityError as err:
         logger.error(err)
         raise HTTPException(status_code=503, detail=f"Database error: {err}")
+    if result.skipped:
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    user = result.users[0]
+    if user.created:
+        response.status_code = 201
+    await _set_consistency_token(response, db_session)
+    response.headers["ETag"] = user_etag(user.version)
+    return user
+
+
+@user_router.put("/batch", response_model=UpsertUsersResponse)
+async def upsert_users(
+    bodies: list[CreateUser],
+    response: Response,
+    db_session: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> UpsertUsersResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    if not bodies:
+        raise HTTPException(status_code=422, detail="No users to upsert")
+    if len(bodies) > settings.USER_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.USER_BATCH_MAX_SIZE} users per request",
+        )
+    # a single ON CONFLICT DO UPDATE can't touch the same row twice
+    if len({body.email.lower() for body in bodies}) != len(bodies):
+        raise HTTPException(status_code=422, detail="Emails should be unique")
+    try:
+        result = await _upsert_users(bodies, db_session)
+    except IntegrityError as err:
+        logger.error(err)
+        raise HTTPException(status_code=503, detail=f"Database error: {err}")
+    await _set_consistency_token(response, db_session)
+    return result
 
 
 @user_router.delete("/", response_model=DeleteUserResponse)
 async def delete_user(
     user_id: UUID,
+    response: Response,
+    if_match: Optional[str] = Header(default=None),
     db_session: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token),
 ) -> DeleteUserResponse:
-    user_to_delete = await _get_user_by_id(user_id=user_id, db_session=db_session)
-    if user_to_delete is None:
+    versions = parse_etags(if_match, weak=False) if if_match is not None else None
+    result = await _delete_user_if(
+        user_id=user_id,
+        condition=user_permission_clause(current_user),
+        db_session=db_session,
+        versions=versions,
+    )
+    if result is None:
         raise HTTPException(
             status_code=404, detail=f"User with id {user_id} doesn't exist"
         )
-    if not check_user_permissions(
-        target_user=user_to_delete,
-        current_user=current_user,
-    ):
-        raise HTTPException(status_code=403, detail="Not allowed.")
-    deleted_user_id = await _delete_user(user_id, db_session)
-    if deleted_user_id is None:
+    if result.updated_user_id is None:
+        if result.permitted and result.is_active:
+            if versions is not None:
+                # only the If-Match version check can have failed
+                raise HTTPException(status_code=412, detail=USER_MODIFIED_DETAIL)
+            # a concurrent transaction changed the row under the statement
+            raise HTTPException(status_code=409, detail=USER_MODIFIED_DETAIL)
+        if not check_user_permissions(target_user=result, current_user=current_user):
+            raise HTTPException(status_code=403, detail="Not allowed.")
+        # the user exists but was already deleted
         raise HTTPException(
             status_code=404, detail=f"User with id {user_id} doesn't exist"
         )
 
-    return DeleteUserResponse(deleted_user_id=deleted_user_id)
+    await _set_consistency_token(response, db_session)
+    response.headers["ETag"] = user_etag(result.updated_version)
+    return DeleteUserResponse(deleted_user_id=result.updated_user_id)
+
+
+@user_router.post("/restore", response_model=UpdateUserResponse)
+async def restore_archived_user(
+    user_id: UUID,
+    response: Response,
+    db_session: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> UpdateUserResponse:
+    """Bring an archived user back as an active account."""
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    restored_user_id = await restore_user(user_id, db_session)
+    if restored_user_id is None:
+        if await is_user_archived(user_id, db_session):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Email of the user with id {user_id} is taken",
+            )
+        raise HTTPException(
+            status_code=404, detail=f"Archived user with id {user_id} doesn't exist"
+        )
+    await _set_consistency_token(response, db_session)
+    return UpdateUserResponse(updated_user_id=restored_user_id)
 
 
 @user_router.get("/", response_model=ShowUser)
 async def get_user_by_id(
     user_id: UUID,
-    db_session: AsyncSession = Depends(get_db),
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
+    db_session: AsyncSession = Depends(get_db_read),
     current_user: User = Depends(get_current_user_from_token),
 ) -> ShowUser:
     user = await _get_user_by_id(user_id, db_session)
@@ -77,13 +234,126 @@ async def get_user_by_id(
         raise HTTPException(
             status_code=404, detail=f"User with id {user_id} doesn't exist"
         )
+    etag = user_etag(user.version)
+    if if_none_match is not None:
+        versions = parse_etags(if_none_match, weak=True)
+        if versions is None or user.version in versions:
+            # the client's copy is current, no body is serialized
+            return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return user
 
 
+@user_router.post("/lookup", response_model=GetUsersResponse)
+async def get_users_by_ids(
+    body: GetUsersRequest,
+    db_session: AsyncSession = Depends(get_db_read),
+    current_user: User = Depends(get_current_user_from_token),
+) -> GetUsersResponse:
+    if len(body.user_ids) > settings.USER_LOOKUP_MAX_IDS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {settings.USER_LOOKUP_MAX_IDS} ids per request",
+        )
+    return await _get_users_by_ids(body.user_ids, db_session)
+
+
+@user_router.get("/list", response_model=ListUsersResponse)
+async def list_users(
+    order_by: UserListOrder = UserListOrder.USER_ID,
+    cursor: Optional[str] = None,
+    limit: int = Query(
+        default=settings.USER_LIST_DEFAULT_PAGE_SIZE,
+        ge=1,
+        le=settings.USER_LIST_MAX_PAGE_SIZE,
+    ),
+    is_active: Optional[bool] = None,
+    role: Optional[UserRole] = None,
+    db_session: AsyncSession = Depends(get_db_read),
+    current_user: User = Depends(get_current_user_from_token),
+) -> ListUsersResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    return await _list_users(
+        order_by=order_by,
+        cursor=cursor,
+        limit=limit,
+        is_active=is_active,
+        role=role,
+        db_session=db_session,
+    )
+
+
+@user_router.get("/search", response_model=ListUsersResponse)
+async def search_users(
+    q: str = Query(min_length=3),
+    cursor: Optional[str] = None,
+    limit: int = Query(
+        default=settings.USER_LIST_DEFAULT_PAGE_SIZE,
+        ge=1,
+        le=settings.USER_LIST_MAX_PAGE_SIZE,
+    ),
+    db_session: AsyncSession = Depends(get_db_read),
+    current_user: User = Depends(get_current_user_from_token),
+) -> ListUsersResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    return await _search_users(
+        query=q, cursor=cursor, limit=limit, db_session=db_session
+    )
+
+
+@user_router.get("/export")
+async def export_users(
+    export_format: UserExportFormat = Query(
+        default=UserExportFormat.NDJSON, alias="format"
+    ),
+    db_session: AsyncSession = Depends(get_db_read),
+    current_user: User = Depends(get_current_user_from_token),
+) -> StreamingResponse:
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    return StreamingResponse(
+        _export_users(export_format, db_session),
+        media_type=USER_EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="users.{export_format.value}"'
+        },
+    )
+
+
+@user_router.post("/import", response_model=ImportUsersResponse)
+async def import_users_from_file(
+    request: Request,
+    import_format: ImportFormat = Query(default=ImportFormat.NDJSON, alias="format"),
+    db_session: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user_from_token),
+) -> ImportUsersResponse:
+    """Load the request body, streamed in chunks, as new users.
+
+    Runs within the request deadline, large migrations go through
+    `python cli.py import-users` instead.
+    """
+    if not (current_user.is_admin or current_user.is_superadmin):
+        raise HTTPException(status_code=403, detail="Forbidden.")
+    rejects = []
+    stats = await import_users(
+        iter_lines(request.stream()),
+        import_format,
+        db_session,
+        on_reject=lambda line, email, reason: rejects.append(
+            ImportReject(line=line, email=email, reason=reason)
+        ),
+    )
+    return ImportUsersResponse(**stats.as_dict(), rejects=rejects)
+
+
 @user_router.patch("/", response_model=UpdateUserResponse)
 async def update_user_by_id(
     user_id: UUID,
     body: UpdateUserRequest,
+    response: Response,
+    if_match: Optional[str] = Header(default=None),
     db_session: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token),
 ) -> UpdateUserResponse:
@@ -92,32 +362,45 @@ async def update_user_by_id(
         raise HTTPException(
             status_code=422, detail="At least one parametr to update should be provided"
         )
-    user_to_update = await _get_user_by_id(user_id, db_session)
-    if user_to_update is None:
-        raise HTTPException(
-            status_code=404, detail=f"User with id {user_id} doesn't exist"
-        )
-    if user_id != current_user.user_id:
-        if check_user_permissions(
-            target_user=user_to_update, current_user=current_user
-        ):
-            raise HTTPException(status_code=403, detail="Forbidden.")
-
+    versions = parse_etags(if_match, weak=False) if if_match is not None else None
     try:
-        updated_user_id = await _update_user(
+        result = await _update_user_if(
             user_params_to_update=user_params_to_update,
             user_id=user_id,
+            condition=update_permission_clause(user_id, current_user),
             db_session=db_session,
+            versions=versions,
         )
     except IntegrityError as err:
         logger.error(err)
         raise HTTPException(status_code=503, detail=f"Database error: {err}")
-    return UpdateUserResponse(updated_user_id=updated_user_id)
+    if result is None:
+        raise HTTPException(
+            status_code=404, detail=f"User with id {user_id} doesn't exist"
+        )
+    if result.updated_user_id is None:
+        if result.permitted and result.is_active:
+            if versions is not None:
+                # only the If-Match version check can have failed
+                raise HTTPException(status_code=412, detail=USER_MODIFIED_DETAIL)
+            # a concurrent transaction changed the row under the statement
+            raise HTTPException(status_code=409, detail=USER_MODIFIED_DETAIL)
+        if user_id != current_user.user_id and check_user_permissions(
+            target_user=result, current_user=current_user
+        ):
+            raise HTTPException(status_code=403, detail="Forbidden.")
+        raise HTTPException(
+            status_code=404, detail=f"User with id {user_id} doesn't exist"
+        )
+    await _set_consistency_token(response, db_session)
+    response.headers["ETag"] = user_etag(result.updated_version)
+    return UpdateUserResponse(updated_user_id=result.updated_user_id)
 
 
 @user_router.patch("/admin_privilege", response_model=UpdateUserResponse)
 async def grant_admin_privilages(
     user_id: UUID,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token),
 ):
@@ -127,57 +410,52 @@ async def grant_admin_privilages(
         raise HTTPException(
             status_code=400, detail="It's impossible to grant privileges to yourself"
         )
-    user_to_grant = await _get_user_by_id(user_id, db)
-    if user_to_grant.is_admin or user_to_grant.is_superadmin:
-        raise HTTPException(
-            status_code=409,
-            detail=f"User with id {user_id} is already an admin",
-        )
-
-    if user_to_grant is None:
-        raise HTTPException(status_code=404, detail=f"User with id{user_id} not found")
-    updated_user_roles = {"roles": user_to_grant.add_admin_privilages()}
     try:
-        updated_user_roles = await _update_user(
-            user_params_to_update=updated_user_roles,
-            db_session=db,
-            user_id=user_id,
-        )
+        result = await _grant_admin_privilege(user_id=user_id, db_session=db)
     except IntegrityError as err:
         logger.error(err)
         raise HTTPException(status_code=503, detail=f"Database error: {err}")
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"User with id{user_id} not found")
+    if result.updated_user_id is None:
+        if result.role_mask & PRIVILEGED_ROLES_MASK:
+            raise HTTPException(
+                status_code=409,
+                detail=f"User with id {user_id} is already an admin",
+            )
+        raise HTTPException(status_code=404, detail=f"User with id{user_id} not found")
+    await _set_consistency_token(response, db)
     return UpdateUserResponse(updated_user_id=user_id)
 
 
 @user_router.delete("/admin_privilege", response_model=UpdateUserResponse)
 async def revoke_admin_privileges(
     user_id: UUID,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user_from_token),
 ):
     if not current_user.is_superadmin:
         raise HTTPException(status_code=403, detail="Forbidden")
-    user_to_revoke_admon_priviileges = await _get_user_by_id(user_id, db)
-    if not user_to_revoke_admon_priviileges.is_admin:
-        raise HTTPException(
-            status_code=409, detail=f"User with id {user_id} is not an admin"
-        )
-    if user_to_revoke_admon_priviileges is None:
-        raise HTTPException(status_code=404, detail=f"User with id{user_id} not found")
-    if current_user.user_id == user_id:
-        raise HTTPException(
-            status_code=400, detail="It's impossible to grant privileges to yourself"
-        )
-    updated_user_roles = {
-        "roles": user_to_revoke_admon_priviileges.revoke_admin_privileges()
-    }
     try:
-        updated_user_roles = await _update_user(
-            user_params_to_update=updated_user_roles,
-            db_session=db,
-            user_id=user_id,
+        result = await _revoke_admin_privilege(
+            user_id=user_id, current_user=current_user, db_session=db
         )
     except IntegrityError as err:
         logger.error(err)
         raise HTTPException(status_code=503, detail=f"Database error: {err}")
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"User with id{user_id} not found")
+    if result.updated_user_id is None:
+        if not result.role_mask & ADMIN_BIT:
+            raise HTTPException(
+                status_code=409, detail=f"User with id {user_id} is not an admin"
+            )
+        if current_user.user_id == user_id:
+            raise HTTPException(
+                status_code=400,
+                detail="It's impossible to grant privileges to yourself",
+            )
+        raise HTTPException(status_code=404, detail=f"User with id{user_id} not found")
+    await _set_consistency_token(response, db)
     return UpdateUserResponse(updated_user_id=user_id)
@@ -6,9 +6,11 @@ from fastapi import HTTPException
 from pydantic import BaseModel
 from pydantic import constr
 from pydantic import EmailStr
+from pydantic import root_validator
 from pydantic import validator
 
 LETTER_MATCH_PATTERN = re.compile(r"^[a-z-A-Z\-]+$")
+BCRYPT_HASH_PATTERN = re.compile(r"^\$2[aby]?\$\d{2}\$[./A-Za-z0-9]{53}$")
 
 
 # Adjust class to make sure pydantic will convert even non dict objects to json
@@ -50,6 +52,81 @@ class CreateUser(BaseModel):
         return value
 
 
+class GetUsersRequest(BaseModel):
+    user_ids: list[uuid.UUID]
+
+
+class GetUsersResponse(BaseModel):
+    users: list[ShowUser]
+    missing_ids: list[uuid.UUID]
+
+
+class ListUsersResponse(BaseModel):
+    users: list[ShowUser]
+    # pass back as `cursor` to get the next page, None on the last page
+    next_cursor: Optional[str]
+
+
+class CreateUserResult(BaseModel):
+    email: EmailStr
+    # "created" or "conflict" when the email is already taken
+    status: str
+    user: Optional[ShowUser]
+
+
+class CreateUsersResponse(BaseModel):
+    created: int
+    conflicts: int
+    results: list[CreateUserResult]
+
+
+class UpsertUserResponse(ShowUser):
+    version: int
+    # false when an existing account with this email was updated
+    created: bool
+
+
+class UpsertUsersResponse(BaseModel):
+    created: int
+    updated: int
+    users: list[UpsertUserResponse]
+    # emails of privileged accounts, which are never overwritten
+    skipped: list[EmailStr]
+
+
+class ImportUser(CreateUser):
+    """Row of a bulk import, with a plaintext password or a bcrypt hash."""
+
+    password: Optional[str]
+    hashed_password: Optional[str]
+
+    @root_validator(skip_on_failure=True)
+    def validate_password(cls, values):
+        password, hashed_password = values.get("password"), values.get(
+            "hashed_password"
+        )
+        if bool(password) == bool(hashed_password):
+            raise ValueError("Either password or hashed_password should be provided")
+        if hashed_password and not BCRYPT_HASH_PATTERN.match(hashed_password):
+            raise ValueError("hashed_password should be a bcrypt hash")
+        return values
+
+
+class ImportReject(BaseModel):
+    line: int
+    email: Optional[str]
+    reason: str
+
+
+class ImportUsersResponse(BaseModel):
+    rows: int
+    imported: int
+    rejected: int
+    seconds: float
+    rows_per_second: float
+    rejects: list[ImportReject]
+
+
 class DeleteUserResponse(BaseModel):
     deleted_user_id: uuid.UUID
 
@@ -82,4 +159,17 @@ class UpdateUserRequest(BaseModel):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: Optional[str]
     token_type: str
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
+
+class RevokeTokenRequest(BaseModel):
+    refresh_token: Optional[str]
+
+
+class RevokeTokenResponse(BaseModel):
+    revoked_jtis: list[str]
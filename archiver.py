@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime
+from datetime import timedelta
+from logging import getLogger
+from time import perf_counter
+from typing import Optional
+from uuid import UUID
+
+import settings
+from db.crud import UserCRUD
+
+logger = getLogger(__name__)
+
+# progress of the archival job in this process, served by /service/metrics
+archive_stats = {
+    "running": False,
+    "runs": 0,
+    "batches": 0,
+    "archived": 0,
+    "restored": 0,
+    "last_run_archived": 0,
+    "last_run_at": None,
+    "last_run_ms": None,
+}
+
+
+async def archive_inactive_users(
+    session_factory,
+    older_than_days: int,
+    batch_size: int,
+    pause: float,
+    max_batches: Optional[int] = None,
+) -> int:
+    """Move users deactivated more than `older_than_days` ago to users_archive.
+
+    Every batch is its own short transaction that locks at most
+    `batch_size` rows, and the job sleeps `pause` seconds between batches
+    so it never holds locks or I/O for long. Returns how many users moved.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    started_at = perf_counter()
+    archive_stats["running"] = True
+    archive_stats["last_run_archived"] = 0
+    archived = 0
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            async with session_factory() as db_session:
+                async with db_session.begin():
+                    user_crud = UserCRUD(db_session)
+                    moved = await user_crud.archive_users(cutoff, batch_size)
+            batches += 1
+            archived += moved
+            archive_stats["batches"] += 1
+            archive_stats["archived"] += moved
+            archive_stats["last_run_archived"] = archived
+            if moved < batch_size:
+                break
+            await asyncio.sleep(pause)
+    finally:
+        archive_stats["running"] = False
+        archive_stats["runs"] += 1
+        archive_stats["last_run_at"] = datetime.utcnow().isoformat()
+        archive_stats["last_run_ms"] = round((perf_counter() - started_at) * 1000, 2)
+    logger.info(f"Archived {archived} inactive users in {batches} batches")
+    return archived
+
+
+async def restore_user(user_id: UUID, db_session) -> Optional[UUID]:
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        restored_user_id = await user_crud.restore_user(user_id)
+    if restored_user_id is not None:
+        archive_stats["restored"] += 1
+    return restored_user_id
+
+
+async def is_user_archived(user_id: UUID, db_session) -> bool:
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        return await user_crud.is_user_archived(user_id)
+
+
+async def run_archival(session_factory):
+    """Archive inactive users every USER_ARCHIVE_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(settings.USER_ARCHIVE_INTERVAL_SECONDS)
+        try:
+            await archive_inactive_users(
+                session_factory,
+                older_than_days=settings.USER_ARCHIVE_AFTER_DAYS,
+                batch_size=settings.USER_ARCHIVE_BATCH_SIZE,
+                pause=settings.USER_ARCHIVE_PAUSE_SECONDS,
+            )
+        except Exception as err:
+            logger.warning(f"Couldn't archive inactive users: {err}")
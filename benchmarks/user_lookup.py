@@ -0,0 +1,77 @@
+"""Per-lookup cost of UserCRUD.get_user_by_id: ORM path vs asyncpg fast path.
+
+Runs against TEST_DATABASE_URL with migrations applied:
+
+    python -m benchmarks.user_lookup --lookups 5000
+"""
+import argparse
+import asyncio
+from time import perf_counter
+from time import process_time
+from uuid import uuid4
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import text
+
+import settings
+from db.crud import principal_cache
+from db.crud import UserCRUD
+from db.models import UserRole
+
+
+async def _run_lookups(async_session, user_id, lookups: int) -> tuple[float, float]:
+    async with async_session() as db_session:
+        # warm up the connection and the prepared statement cache
+        async with db_session.begin():
+            await UserCRUD(db_session).get_user_by_id(user_id)
+        started_wall, started_cpu = perf_counter(), process_time()
+        for _ in range(lookups):
+            async with db_session.begin():
+                user = await UserCRUD(db_session).get_user_by_id(user_id)
+            assert user is not None
+            db_session.expunge_all()
+        return perf_counter() - started_wall, process_time() - started_cpu
+
+
+async def main(lookups: int):
+    engine = create_async_engine(settings.TEST_DATABASE_URL, future=True)
+    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    user_id = uuid4()
+    async with engine.begin() as connection:
+        await connection.execute(
+            text(
+                "INSERT INTO users (user_id, name, surname, email, is_active, "
+                "hashed_password, roles) VALUES (:user_id, 'Bench', 'Mark', "
+                ":email, true, 'hash', :roles)"
+            ),
+            {
+                "user_id": user_id,
+                "email": f"{user_id}@bench.com",
+                "roles": [UserRole.ROLE_USER_SIMPLE],
+            },
+        )
+    principal_cache.clear()
+    try:
+        for fast_path in (False, True):
+            settings.USER_LOOKUP_FAST_PATH = fast_path
+            wall, cpu = await _run_lookups(async_session, user_id, lookups)
+            print(
+                f"{'asyncpg' if fast_path else 'orm':>8}: "
+                f"{wall / lookups * 1e6:8.1f} us wall, "
+                f"{cpu / lookups * 1e6:8.1f} us cpu per lookup"
+            )
+    finally:
+        async with engine.begin() as connection:
+            await connection.execute(
+                text("DELETE FROM users WHERE user_id = :user_id"),
+                {"user_id": user_id},
+            )
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lookups", type=int, default=5000)
+    asyncio.run(main(parser.parse_args().lookups))
@@ -0,0 +1,133 @@
+"""Maintenance commands, e.g.
+
+python cli.py import-users users.csv --format csv --rejects rejects.ndjson
+python cli.py archive-users --older-than-days 180
+python cli.py restore-user 3f1c...
+"""
+import argparse
+import asyncio
+import json
+import sys
+from logging import basicConfig
+from logging import INFO
+from uuid import UUID
+
+import settings
+from archiver import archive_inactive_users
+from archiver import archive_stats
+from archiver import restore_user
+from db import session
+from hashing import async_hasher
+from importer import import_users
+from importer import ImportFormat
+
+
+async def _read_lines(path: str):
+    with open(path, encoding="utf-8") as users_file:
+        for line in users_file:
+            yield line
+
+
+async def import_users_command(args) -> int:
+    session.init_engines()
+    try:
+        with open(args.rejects, "w", encoding="utf-8") as rejects_file:
+
+            def write_reject(line: int, email: str, reason: str):
+                rejects_file.write(
+                    json.dumps({"line": line, "email": email, "reason": reason}) + "\n"
+                )
+
+            async with session.async_session() as db_session:
+                stats = await import_users(
+                    _read_lines(args.path),
+                    ImportFormat(args.format),
+                    db_session,
+                    on_reject=write_reject,
+                )
+    finally:
+        async_hasher.shutdown()
+        await session.dispose_engines()
+    print(json.dumps(stats.as_dict()))
+    return 0 if stats.rejected == 0 else 1
+
+
+async def archive_users_command(args) -> int:
+    session.init_engines()
+    try:
+        await archive_inactive_users(
+            session.async_session,
+            older_than_days=args.older_than_days,
+            batch_size=args.batch_size,
+            pause=args.pause,
+            max_batches=args.max_batches,
+        )
+    finally:
+        await session.dispose_engines()
+    print(json.dumps(archive_stats))
+    return 0
+
+
+async def restore_user_command(args) -> int:
+    session.init_engines()
+    try:
+        async with session.async_session() as db_session:
+            restored_user_id = await restore_user(args.user_id, db_session)
+    finally:
+        await session.dispose_engines()
+    if restored_user_id is None:
+        print(f"User {args.user_id} isn't archived or its email is taken")
+        return 1
+    print(f"Restored user {restored_user_id}")
+    return 0
+
+
+def main(argv=None) -> int:
+    basicConfig(level=INFO)
+    parser = argparse.ArgumentParser(prog="cli.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser(
+        "import-users", help="bulk load users from an NDJSON or CSV file"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument(
+        "--format", choices=[f.value for f in ImportFormat], default="ndjson"
+    )
+    import_parser.add_argument(
+        "--rejects", default="rejects.ndjson", help="file for the rejected rows"
+    )
+    import_parser.set_defaults(handler=import_users_command)
+
+    archive_parser = commands.add_parser(
+        "archive-users", help="move long deactivated users to users_archive"
+    )
+    archive_parser.add_argument(
+        "--older-than-days", type=int, default=settings.USER_ARCHIVE_AFTER_DAYS
+    )
+    archive_parser.add_argument(
+        "--batch-size", type=int, default=settings.USER_ARCHIVE_BATCH_SIZE
+    )
+    archive_parser.add_argument(
+        "--pause",
+        type=float,
+        default=settings.USER_ARCHIVE_PAUSE_SECONDS,
+        help="seconds to sleep between batches",
+    )
+    archive_parser.add_argument(
+        "--max-batches", type=int, default=None, help="stop after this many batches"
+    )
+    archive_parser.set_defaults(handler=archive_users_command)
+
+    restore_parser = commands.add_parser(
+        "restore-user", help="move an archived user back as an active account"
+    )
+    restore_parser.add_argument("user_id", type=UUID)
+    restore_parser.set_defaults(handler=restore_user_command)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,282 @@
+import asyncio
+import re
+from datetime import datetime
+from datetime import timedelta
+from typing import AsyncIterator
+from typing import Optional
 from typing import Union
 from uuid import UUID
 
 from sqlalchemy import and_
+from sqlalchemy import any_
+from sqlalchemy import bindparam
+from sqlalchemy import case
+from sqlalchemy import delete
+from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy import literal_column
+from sqlalchemy import or_
 from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy import text
+from sqlalchemy import true
 from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
+import settings
+from cache import TTLCache
+from .models import RevokedToken
 from .models import User
+from .models import UserArchive
+from .models import UserReadModel
 from .models import UserRole
 
+
+def email_matches(email: str):
+    """Case-insensitive email condition served by the lower(email) index."""
+    return func.lower(User.email) == email.lower()
+
+
+##########################################
+#  Principal cache in front of lookups #
+##########################################
+
+
+class PrincipalCache:
+    """Users by id, plus an email -> user_id index pointing into it.
+
+    Dropping the id entry is enough to invalidate both lookups: a dangling
+    email key resolves to a miss.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.by_id = TTLCache(max_size=max_size, ttl=ttl)
+        self.email_index = TTLCache(max_size=max_size, ttl=ttl)
+
+    @property
+    def enabled(self) -> bool:
+        return self.by_id.max_size > 0
+
+    def get_by_id(self, user_id: UUID) -> Optional[User]:
+        return self.by_id.get(user_id)
+
+    def get_by_email(self, email: str) -> Optional[User]:
+        user_id = self.email_index.get(email.lower())
+        if user_id is None:
+            return None
+        user = self.by_id.get(user_id)
+        # the email may have changed since the index entry was written
+        if user is not None and user.email.lower() == email.lower():
+            return user
+
+    def put(self, user: User):
+        self.by_id.set(user.user_id, user)
+        self.email_index.set(user.email.lower(), user.user_id)
+
+    def invalidate(self, user_id: UUID):
+        self.by_id.invalidate(user_id)
+
+    def clear(self):
+        self.by_id.clear()
+        self.email_index.clear()
+
+    def stats(self) -> dict:
+        return self.by_id.stats()
+
+
+principal_cache = PrincipalCache(
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL
+)
+
+# user_id -> security_version, checked against self-contained access tokens
+security_version_cache = TTLCache(
+    max_size=settings.SECURITY_VERSION_CACHE_MAX_SIZE,
+    ttl=settings.SECURITY_VERSION_TTL,
+)
+
+
+# a reader may re-cache the old row between the UPDATE and the COMMIT,
+# so entries touched by a transaction are dropped again once it ends
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _invalidate_touched_principals(session: Session):
+    for user_id in session.info.pop("touched_user_ids", ()):
+        principal_cache.invalidate(user_id)
+        security_version_cache.invalidate(user_id)
+
+
+##########################################
+#  Raw asyncpg fast path for hot lookups #
+##########################################
+
+# asyncpg prepares each statement once per connection and reuses it
+_USER_READ_COLUMNS = (
+    "user_id, name, surname, email, is_active, hashed_password, roles, "
+    "security_version, role_mask, version"
+)
+GET_USER_BY_ID_SQL = f"SELECT {_USER_READ_COLUMNS} FROM users WHERE user_id = $1"
+# takes the lowered email, served by the uq_users_email_lower index
+GET_USER_BY_EMAIL_SQL = (
+    f"SELECT {_USER_READ_COLUMNS} FROM users WHERE lower(email) = $1"
+)
+
+
+# bulk imports are COPYed into a per-connection staging table, rows are
+# dropped by the commit that merges them into users
+IMPORT_STAGING_TABLE = "users_import"
+IMPORT_COLUMNS = ("user_id", "name", "surname", "email", "hashed_password")
+CREATE_IMPORT_STAGING_SQL = (
+    f"CREATE TEMP TABLE IF NOT EXISTS {IMPORT_STAGING_TABLE} "
+    "(user_id uuid, name varchar, surname varchar, email varchar, "
+    "hashed_password varchar) ON COMMIT DELETE ROWS"
+)
+MERGE_IMPORT_SQL = (
+    "INSERT INTO users (user_id, name, surname, email, is_active, "
+    "hashed_password, roles) "
+    "SELECT user_id, name, surname, email, true, hashed_password, "
+    f"ARRAY['{UserRole.ROLE_USER_SIMPLE.value}'] FROM {IMPORT_STAGING_TABLE} "
+    "ON CONFLICT DO NOTHING RETURNING user_id"
+)
+
+
+# columns moved between users and users_archive, role_mask is generated
+ARCHIVE_COLUMNS = (
+    "user_id, name, surname, email, is_active, hashed_password, roles, "
+    "security_version, version, deactivated_at"
+)
+# SKIP LOCKED: rows a request is writing are left for the next batch, the
+# job never waits on user traffic
+ARCHIVE_USERS_SQL = (
+    "WITH moved AS (DELETE FROM users WHERE user_id IN ("
+    "SELECT user_id FROM users WHERE NOT is_active AND deactivated_at < :cutoff "
+    "ORDER BY deactivated_at LIMIT :batch_size FOR UPDATE SKIP LOCKED) "
+    f"RETURNING {ARCHIVE_COLUMNS}) "
+    f"INSERT INTO users_archive ({ARCHIVE_COLUMNS}, archived_at) "
+    f"SELECT {ARCHIVE_COLUMNS}, now() AT TIME ZONE 'utc' FROM moved "
+    "RETURNING user_id"
+)
+# the restored account is active again, tokens issued before are not
+RESTORE_USER_SQL = (
+    f"INSERT INTO users ({ARCHIVE_COLUMNS}) "
+    "SELECT user_id, name, surname, email, true, hashed_password, roles, "
+    "security_version + 1, version + 1, NULL FROM users_archive "
+    "WHERE user_id = :user_id ON CONFLICT DO NOTHING RETURNING user_id"
+)
+DELETE_ARCHIVED_USER_SQL = "DELETE FROM users_archive WHERE user_id = :user_id"
+
+
+##########################################
+#  Single-flight coalescing of lookups #
+##########################################
+
+
+class _LeaderGone(Exception):
+    pass
+
+
+class UserLoader:
+    """Share one query between concurrent lookups of users (DataLoader style).
+
+    The first lookup of a batch becomes its leader: it waits `window`
+    seconds (or one event loop tick), then resolves every key requested
+    meanwhile with a single ANY($1) query on its own session. Callers of
+    the same key share one future, also after the window closed and until
+    the query returns. Batches are kept per database engine, so replica and
+    primary reads are never mixed. Nothing is cached once the batch is
+    resolved.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        # batches still collecting keys
+        self._batches: dict[tuple, dict] = {}
+        # futures of requested keys, until their query returned or failed
+        self._pending: dict[tuple, asyncio.Future] = {}
+        self.loads = 0
+        self.queries = 0
+        self.coalesced = 0
+
+    async def load(self, key_name: str, key, db_session: AsyncSession):
+        self.loads += 1
+        batch_key = (key_name, db_session.bind)
+        future = self._pending.get((*batch_key, key))
+        if future is not None:
+            self.coalesced += 1
+        else:
+            batch = self._batches.get(batch_key)
+            if batch is None:
+                batch = self._batches[batch_key] = {}
+                return await self._lead(batch_key, batch, key, db_session)
+            future = self._add(batch_key, batch, key)
+        try:
+            return await asyncio.shield(future)
+        except _LeaderGone:
+            # the leader was cancelled before its query ran, load on our own
+            users = await self._fetch(key_name, [key], db_session)
+            return users.get(key)
+
+    def _add(self, batch_key: tuple, batch: dict, key) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        batch[key] = self._pending[(*batch_key, key)] = future
+        return future
+
+    def _release(self, batch_key: tuple, batch: dict):
+        for key in batch:
+            del self._pending[(*batch_key, key)]
+
+    async def _lead(self, batch_key: tuple, batch: dict, key, db_session):
+        own_future = self._add(batch_key, batch, key)
+        try:
+            await asyncio.sleep(self.window)
+            # new keys start the next batch, keys of this one stay pending
+            del self._batches[batch_key]
+            self.queries += 1
+            users = await self._fetch(batch_key[0], list(batch), db_session)
+        except BaseException as err:
+            if self._batches.get(batch_key) is batch:
+                del self._batches[batch_key]
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(
+                        _LeaderGone()
+                        if isinstance(err, asyncio.CancelledError)
+                        else err
+                    )
+            self._release(batch_key, batch)
+            # consumed here, no "exception was never retrieved" warning
+            own_future.exception()
+            raise
+        for batch_key_value, future in batch.items():
+            future.set_result(users.get(batch_key_value))
+        self._release(batch_key, batch)
+        return own_future.result()
+
+    @staticmethod
+    async def _fetch(key_name: str, keys: list, db_session: AsyncSession) -> dict:
+        user_crud = UserCRUD(db_session)
+        if key_name == "user_id":
+            users = await user_crud.get_users_by_ids(user_ids=keys)
+            return {user.user_id: user for user in users}
+        users = await user_crud.get_users_by_emails(emails=keys)
+        return {user.email.lower(): user for user in users}
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.USER_LOOKUP_COALESCING,
+            "loads": self.loads,
+            "queries": self.queries,
+            "coalesced": self.coalesced,
+        }
+
+
+user_loader = UserLoader(window=settings.USER_LOOKUP_COALESCING_WINDOW)
+
+
 ##########################################
 #  CRUD-Class operations to deal with DB #
 ##########################################
@@ -18,6 +286,18 @@ class UserCRUD:
     def __init__(self, db_session: AsyncSession):
         self.db_session = db_session
 
+    def _cache_principal(self, user: Union[User, UserReadModel]):
+        # a lagging replica could bring back roles that were just revoked
+        if not self.db_session.sync_session.info.get("replica"):
+            principal_cache.put(user)
+
+    def _invalidate_principal(self, user_id: UUID):
+        principal_cache.invalidate(user_id)
+        security_version_cache.invalidate(user_id)
+        self.db_session.sync_session.info.setdefault("touched_user_ids", set()).add(
+            user_id
+        )
+
     async def create_user(
         self,
         name: str,
@@ -37,46 +317,469 @@ class UserCRUD:
         await self.db_session.flush()
         return new_user
 
-    async def delete_user(self, user_id: UUID) -> Union[UUID, None]:
+    async def create_users(self, users: list[dict]) -> list[Row]:
+        """Insert all users in one statement, skipping taken emails.
+
+        Returns the inserted rows only, rows whose email already exists
+        (in the table or earlier in the batch) are left out.
+        """
         query = (
-            update(User)
-            .where(and_(User.user_id == user_id, User.is_active == True))
-            .values(is_active=False)
-            .returning(User.user_id)
+            insert(User)
+            .values(users)
+            # any unique violation, email in a different case included
+            .on_conflict_do_nothing()
+            .returning(
+                User.user_id, User.name, User.surname, User.email, User.is_active
+            )
+        )
+        res = await self.db_session.execute(query)
+        return res.fetchall()
+
+    async def upsert_users(self, users: list[dict], condition=None) -> list[Row]:
+        """Insert users or update the ones whose email is taken, in one statement.
+
+        Rows are matched on lower(email), existing accounts get the new
+        name, surname, email spelling and password hash, but only when they
+        are active and `condition` holds for them; the others are left out
+        of the result. A new hash revokes the tokens issued to the account.
+        Every returned row carries `created`, true for inserted rows (their
+        xmax is 0). Emails must be unique within `users`, a row can't be
+        updated twice by one statement.
+        """
+        # deactivated accounts only come back through restore_user
+        where = User.is_active == True
+        if condition is not None:
+            where = and_(where, condition)
+        query = insert(User).values(users)
+        query = query.on_conflict_do_update(
+            index_elements=[func.lower(User.email)],
+            set_={
+                "name": query.excluded.name,
+                "surname": query.excluded.surname,
+                "email": query.excluded.email,
+                "hashed_password": query.excluded.hashed_password,
+                "security_version": User.security_version + 1,
+                "version": User.version + 1,
+            },
+            where=where,
+        ).returning(
+            User.user_id,
+            User.name,
+            User.surname,
+            User.email,
+            User.is_active,
+            User.version,
+            literal_column("xmax = 0").label("created"),
         )
-        res = await self.db_session.execute(query)  # send coroutine to event loop
-        deleted_user_id_row = res.fetchone()
+        res = await self.db_session.execute(query)
+        rows = res.fetchall()
+        for row in rows:
+            if not row.created:
+                self._invalidate_principal(row.user_id)
+        return rows
 
-        if deleted_user_id_row is not None:
-            return deleted_user_id_row[0]
+    async def copy_users(self, users: list[tuple]) -> set[UUID]:
+        """COPY users into the staging table and merge them into users.
+
+        `users` are tuples in IMPORT_COLUMNS order. Returns the ids that were
+        inserted, rows with an email that is already taken are skipped.
+        """
+        # goes through the session so the transaction is open before COPY
+        await self.db_session.execute(text(CREATE_IMPORT_STAGING_SQL))
+        connection = await self.db_session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            IMPORT_STAGING_TABLE, records=users, columns=IMPORT_COLUMNS
+        )
+        res = await self.db_session.execute(text(MERGE_IMPORT_SQL))
+        return {row.user_id for row in res}
 
-    async def get_user_by_id(self, user_id: UUID) -> Union[User, None]:
+    async def _fetch_user_read_model(
+        self, sql: str, *args
+    ) -> Union[UserReadModel, None]:
+        connection = await self.db_session.connection()
+        raw_connection = await connection.get_raw_connection()
+        row = await raw_connection.driver_connection.fetchrow(sql, *args)
+
+        if row is not None:
+            user = UserReadModel(
+                user_id=row[0],
+                name=row[1],
+                surname=row[2],
+                email=row[3],
+                is_active=row[4],
+                hashed_password=row[5],
+                roles=tuple(row[6]),
+                security_version=row[7],
+                role_mask=row[8],
+                version=row[9],
+            )
+            self._cache_principal(user)
+            return user
+
+    async def get_user_by_id(self, user_id: UUID) -> Union[User, UserReadModel, None]:
+        user = principal_cache.get_by_id(user_id)
+        if user is not None:
+            return user
+        if settings.USER_LOOKUP_COALESCING:
+            return await user_loader.load("user_id", user_id, self.db_session)
+        if settings.USER_LOOKUP_FAST_PATH:
+            return await self._fetch_user_read_model(GET_USER_BY_ID_SQL, user_id)
         query = select(User).where(User.user_id == user_id)
         res = await self.db_session.execute(query)
         user_row = res.fetchone()
 
         if user_row is not None:
+            self._cache_principal(user_row[0])
             return user_row[0]
 
-    async def get_user_by_email(self, email: str) -> Union[User, None]:
-        query = select(User).where(User.email == email)
+    async def get_user_by_email(self, email: str) -> Union[User, UserReadModel, None]:
+        user = principal_cache.get_by_email(email)
+        if user is not None:
+            return user
+        if settings.USER_LOOKUP_COALESCING:
+            return await user_loader.load("email", email.lower(), self.db_session)
+        if settings.USER_LOOKUP_FAST_PATH:
+            return await self._fetch_user_read_model(
+                GET_USER_BY_EMAIL_SQL, email.lower()
+            )
+        query = select(User).where(email_matches(email))
         res = await self.db_session.execute(query)
         user_row = res.fetchone()
 
         if user_row is not None:
+            self._cache_principal(user_row[0])
             return user_row[0]
 
+    async def get_users_by_emails(self, emails: list[str]) -> list[User]:
+        # one `lower(email) = ANY($1)` statement for any number of emails
+        query = select(User).where(
+            func.lower(User.email)
+            == any_(
+                bindparam(
+                    "emails",
+                    value=[email.lower() for email in emails],
+                    type_=ARRAY(String),
+                )
+            )
+        )
+        res = await self.db_session.execute(query)
+        users = res.scalars().all()
+        for user in users:
+            self._cache_principal(user)
+        return users
+
+    async def get_users_by_ids(self, user_ids: list[UUID]) -> list[User]:
+        """Resolve many ids with one `user_id = ANY($1)` query.
+
+        Cached principals are served from memory, only the rest hit the
+        database. Unknown ids are simply absent from the result.
+        """
+        users, missing_ids = [], []
+        for user_id in user_ids:
+            user = principal_cache.get_by_id(user_id)
+            if user is not None:
+                users.append(user)
+            else:
+                missing_ids.append(user_id)
+        if not missing_ids:
+            return users
+        # a single array parameter keeps one prepared statement for any N
+        query = select(User).where(
+            User.user_id
+            == any_(
+                bindparam(
+                    "user_ids",
+                    value=missing_ids,
+                    type_=ARRAY(PG_UUID(as_uuid=True)),
+                )
+            )
+        )
+        res = await self.db_session.execute(query)
+        for user in res.scalars().all():
+            self._cache_principal(user)
+            users.append(user)
+        return users
+
+    async def list_users(
+        self,
+        order_by: str,
+        after: Optional[Union[UUID, str]],
+        limit: int,
+        is_active: Optional[bool] = None,
+        role: Optional[UserRole] = None,
+    ) -> list[User]:
+        """Return the page of users that follows `after` in `order_by` order.
+
+        Keyset pagination: every page is an index range scan starting at the
+        last key of the previous one, no rows are skipped with OFFSET.
+        """
+        sort_column = getattr(User, order_by)
+        query = select(User).order_by(sort_column).limit(limit)
+        if after is not None:
+            query = query.where(sort_column > after)
+        if is_active is not None:
+            query = query.where(User.is_active == is_active)
+        if role is not None:
+            query = query.where(User.roles.contains([role]))
+        res = await self.db_session.execute(query)
+        return res.scalars().all()
+
+    async def search_users(
+        self, query: str, after: Optional[tuple[float, UUID]], limit: int
+    ) -> list[Row]:
+        """Users whose name, surname or email starts with or resembles `query`.
+
+        Rows are (User, rank) ordered by rank, prefix matches first, then by
+        user_id; `after` is the (rank, user_id) of the last row of the
+        previous page. Both conditions are served by the trigram GIN indexes.
+        """
+        columns = (User.name, User.surname, User.email)
+        # LIKE wildcards in the query are matched literally
+        prefix = re.sub(r"([!%_])", r"!\1", query)
+        is_prefix_match = or_(
+            *(column.ilike(f"{prefix}%", escape="!") for column in columns)
+        )
+        rank = (
+            case((is_prefix_match, 1.0), else_=0.0)
+            + func.greatest(*(func.similarity(column, query) for column in columns))
+        ).label("rank")
+        statement = (
+            select(User, rank)
+            .where(
+                or_(
+                    is_prefix_match,
+                    *(column.op("%")(query) for column in columns),
+                )
+            )
+            .order_by(rank.desc(), User.user_id)
+            .limit(limit)
+        )
+        if after is not None:
+            last_rank, last_user_id = after
+            statement = statement.where(
+                or_(
+                    rank < last_rank,
+                    and_(rank == last_rank, User.user_id > last_user_id),
+                )
+            )
+        res = await self.db_session.execute(statement)
+        return res.all()
+
+    async def stream_users(self, chunk_size: int) -> AsyncIterator[list[Row]]:
+        """Yield all users in chunks read from a server-side cursor.
+
+        Only `chunk_size` rows are held in memory at a time, the next chunk
+        is fetched when the caller asks for it.
+        """
+        query = (
+            select(
+                User.user_id,
+                User.name,
+                User.surname,
+                User.email,
+                User.is_active,
+                User.roles,
+            )
+            .order_by(User.user_id)
+            .execution_options(yield_per=chunk_size)
+        )
+        res = await self.db_session.stream(query)
+        async for rows in res.partitions(chunk_size):
+            yield rows
+
+    async def get_security_version(self, user_id: UUID) -> Union[int, None]:
+        security_version = security_version_cache.get(user_id)
+        if security_version is not None:
+            return security_version
+        query = select(User.security_version).where(
+            and_(User.user_id == user_id, User.is_active == True)
+        )
+        res = await self.db_session.execute(query)
+        security_version = res.scalar_one_or_none()
+
+        if security_version is not None:
+            security_version_cache.set(user_id, security_version)
+            return security_version
+
     async def update_user(
         self, user_id: UUID, **user_params_to_update
     ) -> Union[User, None]:
+        if {"roles", "is_active"}.intersection(user_params_to_update):
+            user_params_to_update["security_version"] = User.security_version + 1
+        user_params_to_update["version"] = User.version + 1
         query = (
             update(User)
             .where(and_(User.user_id == user_id, User.is_active == True))
             .values(user_params_to_update)
             .returning(User.user_id)
         )
+        self._invalidate_principal(user_id)
         res = await self.db_session.execute(query)
         updated_user__id_row = res.fetchone()
 
         if updated_user__id_row is not None:
             return updated_user__id_row[0]
+
+    async def update_password_hash(self, user_id: UUID, hashed_password: str) -> None:
+        """Swap the stored hash for a stronger one of the same password.
+
+        Neither version nor security_version is bumped: the password didn't
+        change, so ETags held by clients and issued tokens stay valid.
+        """
+        self._invalidate_principal(user_id)
+        await self.db_session.execute(
+            update(User)
+            .where(and_(User.user_id == user_id, User.is_active == True))
+            .values(hashed_password=hashed_password)
+        )
+
+    async def archive_users(self, deactivated_before: datetime, batch_size: int) -> int:
+        """Move up to `batch_size` users deactivated before the cutoff to
+        users_archive in one statement, returns how many were moved."""
+        res = await self.db_session.execute(
+            text(ARCHIVE_USERS_SQL),
+            {"cutoff": deactivated_before, "batch_size": batch_size},
+        )
+        return len(res.all())
+
+    async def restore_user(self, user_id: UUID) -> Union[UUID, None]:
+        """Move an archived user back to users as an active account.
+
+        Returns None when the user isn't archived or its email was taken
+        meanwhile; the archived row is only dropped once it is restored.
+        """
+        self._invalidate_principal(user_id)
+        res = await self.db_session.execute(
+            text(RESTORE_USER_SQL), {"user_id": user_id}
+        )
+        restored_user_id = res.scalar_one_or_none()
+        if restored_user_id is not None:
+            await self.db_session.execute(
+                text(DELETE_ARCHIVED_USER_SQL), {"user_id": user_id}
+            )
+        return restored_user_id
+
+    async def is_user_archived(self, user_id: UUID) -> bool:
+        query = select(UserArchive.user_id).where(UserArchive.user_id == user_id)
+        res = await self.db_session.execute(query)
+        return res.scalar_one_or_none() is not None
+
+    async def update_user_if(
+        self,
+        user_id: UUID,
+        condition,
+        versions: Optional[list[int]] = None,
+        **user_params_to_update,
+    ) -> Union[Row, None]:
+        """Update an active user only if `condition` holds for its row.
+
+        Returns None when the user doesn't exist, otherwise the row as it was
+        before the statement (user_id, roles, role_mask, is_active, version,
+        permitted: whether `condition` held) plus updated_user_id and
+        updated_version, which are None when nothing was updated. The check
+        and the write are one statement, so there is a single round trip and
+        no race between them. With `versions` the row is only written while
+        its version is one of them (If-Match).
+        """
+        if {"roles", "is_active"}.intersection(user_params_to_update):
+            user_params_to_update["security_version"] = User.security_version + 1
+        user_params_to_update["version"] = User.version + 1
+        target = (
+            select(
+                User.user_id,
+                User.roles,
+                User.role_mask,
+                User.is_active,
+                User.version,
+                condition.label("permitted"),
+            )
+            .where(User.user_id == user_id)
+            .cte("target")
+        )
+        if versions is not None:
+            condition = and_(condition, User.version.in_(versions))
+        # Core table: SQLAlchemy can't nest an ORM UPDATE ... RETURNING in a CTE
+        updated = (
+            update(User.__table__)
+            .where(and_(User.user_id == user_id, User.is_active == True, condition))
+            .values(user_params_to_update)
+            .returning(User.user_id, User.version)
+            .cte("updated")
+        )
+        # data-modifying CTEs see the snapshot from before the update
+        query = select(
+            target.c.user_id,
+            target.c.roles,
+            target.c.role_mask,
+            target.c.is_active,
+            target.c.version,
+            target.c.permitted,
+            updated.c.user_id.label("updated_user_id"),
+            updated.c.version.label("updated_version"),
+        ).select_from(target.outerjoin(updated, true()))
+        self._invalidate_principal(user_id)
+        res = await self.db_session.execute(query)
+        return res.fetchone()
+
+    async def delete_user_if(
+        self, user_id: UUID, condition, versions: Optional[list[int]] = None
+    ) -> Union[Row, None]:
+        return await self.update_user_if(
+            user_id,
+            condition,
+            versions=versions,
+            is_active=False,
+            deactivated_at=datetime.utcnow(),
+        )
+
+
+class RevokedTokenCRUD:
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def revoke_token(self, jti: str, expires_at: datetime) -> None:
+        query = (
+            insert(RevokedToken)
+            .values(jti=jti, expires_at=expires_at)
+            .on_conflict_do_nothing(index_elements=[RevokedToken.jti])
+        )
+        await self.db_session.execute(query)
+
+    async def is_token_revoked(self, jti: str) -> bool:
+        query = select(RevokedToken.jti).where(RevokedToken.jti == jti)
+        res = await self.db_session.execute(query)
+        return res.scalar_one_or_none() is not None
+
+    async def get_revoked_tokens(
+        self, after_id: Optional[int] = None, overlap_seconds: float = 0
+    ) -> list[tuple[int, str]]:
+        """(id, jti) of unexpired revoked tokens, all or those after `after_id`.
+
+        Ids are assigned at insert but become visible at commit, so a lower
+        id may appear after a higher one was read; rows revoked within the
+        last `overlap_seconds` are returned again to catch those.
+        """
+        query = select(RevokedToken.id, RevokedToken.jti).where(
+            RevokedToken.expires_at > datetime.utcnow()
+        )
+        if after_id is not None:
+            query = query.where(
+                or_(
+                    RevokedToken.id > after_id,
+                    RevokedToken.revoked_at
+                    > func.timezone("utc", func.now())
+                    - timedelta(seconds=overlap_seconds),
+                )
+            )
+        res = await self.db_session.execute(query)
+        return res.all()
+
+    async def delete_expired_tokens(self) -> int:
+        query = (
+            delete(RevokedToken)
+            .where(RevokedToken.expires_at <= datetime.utcnow())
+            .returning(RevokedToken.jti)
+        )
+        res = await self.db_session.execute(query)
+        return len(res.all())
@@ -0,0 +1,2 @@
+-- trigram indexes of the user search (ix_users_*_trgm)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
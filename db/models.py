@@ -1,9 +1,18 @@
 import uuid
+from datetime import datetime
 from enum import Enum
+from typing import Optional
 
+from sqlalchemy import BigInteger
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import Computed
+from sqlalchemy import DateTime
+from sqlalchemy import Identity
+from sqlalchemy import Index
+from sqlalchemy import Integer
 from sqlalchemy import String
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
@@ -22,8 +31,60 @@ class UserRole(str, Enum):
     ROLE_USER_SUPERADMIN = "ROLE_USER_SUPERADMIN"
 
 
+# bit of every role in User.role_mask; never reuse a bit, stored masks keep it
+ROLE_BITS = {
+    UserRole.ROLE_USER_SIMPLE: 1,
+    UserRole.ROLE_USER_ADMIN: 2,
+    UserRole.ROLE_USER_SUPERADMIN: 4,
+}
+ADMIN_BIT = ROLE_BITS[UserRole.ROLE_USER_ADMIN]
+SUPERADMIN_BIT = ROLE_BITS[UserRole.ROLE_USER_SUPERADMIN]
+PRIVILEGED_ROLES_MASK = ADMIN_BIT | SUPERADMIN_BIT
+
+# postgres keeps role_mask in sync with roles, which also converts the rows
+# that exist when the column is added
+ROLE_MASK_SQL = " | ".join(
+    f"(CASE WHEN '{role.value}' = ANY(roles) THEN {bit} ELSE 0 END)"
+    for role, bit in ROLE_BITS.items()
+)
+
+
+def roles_to_mask(roles) -> int:
+    mask = 0
+    for role in roles:
+        mask |= ROLE_BITS.get(role, 0)
+    return mask
+
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # emails are unique regardless of case, lookups go through lower(email)
+        Index("uq_users_email_lower", text("lower(email)"), unique=True),
+        # keyset pagination of active users, deactivated rows stay out of
+        # the index; the unfiltered listing walks the primary key and the
+        # email unique index
+        Index("ix_users_active_user_id", "user_id", postgresql_where=text("is_active")),
+        Index("ix_users_active_email", "email", postgresql_where=text("is_active")),
+        # candidates of the archival job, only deactivated rows are indexed
+        Index(
+            "ix_users_deactivated_at",
+            "deactivated_at",
+            postgresql_where=text("NOT is_active"),
+        ),
+        # role filter, `roles @> ARRAY[role]`
+        Index("ix_users_roles", "roles", postgresql_using="gin"),
+        # prefix (ILIKE 'q%') and similarity (%) search, needs pg_trgm
+        *(
+            Index(
+                f"ix_users_{column}_trgm",
+                column,
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+            for column in ("name", "surname", "email")
+        ),
+    )
 
     user_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
@@ -32,19 +93,149 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     hashed_password = Column(String, nullable=False)
     roles = Column(ARRAY(String), nullable=False)
+    # bumped on every role change or deactivation to invalidate issued tokens
+    security_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # bitwise form of roles (ROLE_BITS), computed by postgres on every write
+    role_mask = Column(Integer, Computed(ROLE_MASK_SQL, persisted=True), nullable=False)
+    # bumped on every write, served as the ETag of the user resource
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # set on deactivation, the archival job moves rows old enough to
+    # users_archive
+    deactivated_at = Column(DateTime, nullable=True)
 
     @property
     def is_superadmin(self) -> bool:
-        return UserRole.ROLE_USER_SUPERADMIN in self.roles
+        return bool(self.role_mask & SUPERADMIN_BIT)
 
     @property
     def is_admin(self) -> bool:
-        return UserRole.ROLE_USER_ADMIN in self.roles
+        return bool(self.role_mask & ADMIN_BIT)
+
+
+def has_any_role(mask: int):
+    """SQL condition: the user holds at least one role of `mask`."""
+    return User.role_mask.op("&")(mask) != 0
+
+
+class UserArchive(Base):
+    """Deactivated users moved out of the hot users table."""
+
+    __tablename__ = "users_archive"
+
+    user_id = Column(UUID(as_uuid=True), primary_key=True)
+    name = Column(String, nullable=False)
+    surname = Column(String, nullable=False)
+    email = Column(String, nullable=False)
+    is_active = Column(Boolean, nullable=False)
+    hashed_password = Column(String, nullable=False)
+    roles = Column(ARRAY(String), nullable=False)
+    security_version = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    deactivated_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False)
+    # database clock, app hosts may drift apart
+    revoked_at = Column(
+        DateTime,
+        nullable=False,
+        server_default=text("(now() AT TIME ZONE 'utc')"),
+        index=True,
+    )
+    # handed out by the database in insert order, the sync watermark of the
+    # revocation list
+    id = Column(BigInteger, Identity(), nullable=False, unique=True)
+
+
+class Principal:
+    """Authenticated caller rebuilt from access token claims, without a DB row."""
+
+    __slots__ = (
+        "user_id",
+        "email",
+        "roles",
+        "is_active",
+        "security_version",
+        "role_mask",
+    )
+
+    def __init__(
+        self,
+        user_id: uuid.UUID,
+        email: str,
+        roles: tuple,
+        is_active: bool,
+        security_version: int,
+        role_mask: Optional[int] = None,
+    ):
+        object.__setattr__(self, "user_id", user_id)
+        object.__setattr__(self, "email", email)
+        object.__setattr__(self, "roles", roles)
+        object.__setattr__(self, "is_active", is_active)
+        object.__setattr__(self, "security_version", security_version)
+        # computed once, permission checks are single bitwise tests
+        if role_mask is None:
+            role_mask = roles_to_mask(roles)
+        object.__setattr__(self, "role_mask", role_mask)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> "Principal":
+        return cls(
+            user_id=uuid.UUID(claims["uid"]),
+            email=claims["sub"],
+            roles=tuple(claims["roles"]),
+            is_active=True,
+            security_version=claims["sv"],
+        )
+
+    @property
+    def is_superadmin(self) -> bool:
+        return bool(self.role_mask & SUPERADMIN_BIT)
+
+    @property
+    def is_admin(self) -> bool:
+        return bool(self.role_mask & ADMIN_BIT)
+
+
+class UserReadModel(Principal):
+    """Read-only user row loaded by the asyncpg fast path.
+
+    Carries everything ShowUser, check_user_permissions and the login path
+    need, without an ORM identity map entry behind it.
+    """
 
-    def add_admin_privilages(self):
-        if not self.is_admin:
-            return {*self.roles, UserRole.ROLE_USER_ADMIN}
+    __slots__ = ("name", "surname", "hashed_password", "version")
 
-    def revoke_admin_privileges(self):
-        if self.is_admin:
-            return {role for role in self.roles if role != UserRole.ROLE_USER_ADMIN}
+    def __init__(
+        self,
+        user_id: uuid.UUID,
+        name: str,
+        surname: str,
+        email: str,
+        is_active: bool,
+        hashed_password: str,
+        roles: tuple,
+        security_version: int,
+        role_mask: Optional[int] = None,
+        version: Optional[int] = None,
+    ):
+        super().__init__(
+            user_id=user_id,
+            email=email,
+            roles=roles,
+            is_active=is_active,
+            security_version=security_version,
+            role_mask=role_mask,
+        )
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "surname", surname)
+        object.__setattr__(self, "hashed_password", hashed_password)
+        object.__setattr__(self, "version", version)
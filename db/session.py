@@ -1,23 +1,311 @@
+import asyncio
+from bisect import bisect_left
+from contextlib import AsyncExitStack
+from time import monotonic
+from time import perf_counter
 from typing import Generator
+from typing import Optional
 
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 import settings
+from deadline import bounded_timeout
+from deadline import DeadlineExceeded
+from deadline import remaining_time
 
+##########################################
+#  Connection pool with checkout timing #
+##########################################
 
-# create async engine for interaction with database
-engine = create_async_engine(settings.PROD_DATABASE_URL, future=True, echo=True)
 
-# create session for the interaction with database
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+class CheckoutStats:
+    """Histogram of how long checkouts waited for a pooled connection."""
+
+    BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.timeouts = 0
+
+    def observe(self, wait_ms: float):
+        self.counts[bisect_left(self.BUCKETS_MS, wait_ms)] += 1
+        self.total_ms += wait_ms
+        self.max_ms = max(self.max_ms, wait_ms)
+
+    def stats(self) -> dict:
+        checkouts = sum(self.counts)
+        buckets = {
+            f"le_{bound}ms": count for bound, count in zip(self.BUCKETS_MS, self.counts)
+        }
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "checkouts": checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": self.total_ms / checkouts if checkouts else 0.0,
+            "max_wait_ms": self.max_ms,
+            "wait_histogram": buckets,
+        }
+
+
+# module level so the numbers survive pool re-creation on dispose()
+checkout_stats = CheckoutStats()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    # QueuePool reads _timeout on every checkout, bounding it here keeps
+    # requests from waiting for a connection past their deadline; the
+    # configured value lives in _pool_timeout
+    @property
+    def _timeout(self) -> float:
+        return bounded_timeout(self._pool_timeout)
+
+    @_timeout.setter
+    def _timeout(self, timeout: float):
+        self._pool_timeout = timeout
+
+    def timeout(self) -> float:
+        return self._pool_timeout
+
+    def recreate(self) -> "InstrumentedQueuePool":
+        # a pool recreated during a request must not inherit its deadline
+        pool = super().recreate()
+        pool._pool_timeout = self._pool_timeout
+        return pool
+
+    def _do_get(self):
+        started_at = perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            checkout_stats.timeouts += 1
+            raise
+        checkout_stats.observe((perf_counter() - started_at) * 1000)
+        return connection
+
+
+def _create_engine(database_url: str):
+    server_settings = {}
+    if settings.REQUEST_TIMEOUT_SECONDS > 0:
+        # sent with the startup packet, no query runs longer than a request
+        # may take without an extra round trip per transaction
+        server_settings["statement_timeout"] = str(
+            int(settings.REQUEST_TIMEOUT_SECONDS * 1000)
+        )
+    return create_async_engine(
+        database_url,
+        future=True,
+        echo=settings.DB_ECHO,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={"server_settings": server_settings},
+    )
+
+
+# engines are created by init_engines() on startup or first use, so importing
+# this module neither needs the database settings nor builds a pool
+engine = None
+read_engine = None
+
+# create session for the interaction with database, bound in init_engines()
+async_session = sessionmaker(expire_on_commit=False, class_=AsyncSession)
+
+# read-only sessions go to a streaming replica, reads use the primary
+# when no replica is configured
+async_read_session = sessionmaker(expire_on_commit=False, class_=AsyncSession)
+
+
+def init_engines():
+    global engine, read_engine
+    if engine is not None:
+        return
+    engine = _create_engine(settings.PROD_DATABASE_URL)
+    async_session.configure(bind=engine)
+    if settings.REPLICA_DATABASE_URL:
+        read_engine = _create_engine(settings.REPLICA_DATABASE_URL)
+        # rows read here may lag behind, UserCRUD keeps them out of caches
+        async_read_session.configure(bind=read_engine, info={"replica": True})
+
+
+async def prewarm_pool(connections: int) -> int:
+    """Open up to `connections` pooled connections and hand them back idle."""
+    init_engines()
+    connections = min(connections, settings.DB_POOL_SIZE)
+    if connections <= 0:
+        return 0
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(
+            *(stack.enter_async_context(engine.connect()) for _ in range(connections))
+        )
+    return connections
+
+
+async def dispose_engines():
+    global engine, read_engine
+    if engine is not None:
+        await engine.dispose()
+    if read_engine is not None:
+        await read_engine.dispose()
+    engine, read_engine = None, None
+
+
+@event.listens_for(Session, "after_begin")
+def _apply_statement_timeout(session, transaction, connection):
+    time_left = remaining_time()
+    if time_left is None:
+        return
+    if time_left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    if not settings.DB_DEADLINE_STATEMENT_TIMEOUT:
+        return
+    # SET LOCAL ends with the transaction, pooled connections keep the default
+    connection.exec_driver_sql(
+        f"SET LOCAL statement_timeout = {max(int(time_left * 1000), 1)}"
+    )
+
+
+def _pool_stats(pool) -> dict:
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+    }
+
+
+def get_pool_stats() -> dict:
+    if engine is None:
+        return {"initialized": False, **checkout_stats.stats()}
+    pool_stats = {**_pool_stats(engine.pool), **checkout_stats.stats()}
+    if read_engine is not None:
+        pool_stats["replica"] = _pool_stats(read_engine.pool)
+    return pool_stats
+
+
+##########################################
+#  Read replica routing #
+##########################################
+
+# writes return the primary WAL position in this header; reads that send it
+# back are served by the primary until the replica has replayed that far
+CONSISTENCY_TOKEN_HEADER = "X-Consistency-Token"
+
+
+def parse_lsn(lsn: str) -> int:
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class ReplicaRouter:
+    """Decides per request whether a read may go to the replica.
+
+    The replica's replay position and lag are fetched at most once per
+    REPLICA_STATUS_TTL seconds and shared by all requests of the worker.
+    """
+
+    def __init__(self, status_ttl: float, max_lag: float):
+        self.status_ttl = status_ttl
+        self.max_lag = max_lag
+        self._replay_lsn: Optional[int] = None
+        self._lag: Optional[float] = None
+        self._checked_at = float("-inf")
+        self.replica_reads = 0
+        self.primary_reads = 0
+
+    async def _refresh_status(self):
+        if monotonic() - self._checked_at < self.status_ttl:
+            return
+        self._checked_at = monotonic()
+        try:
+            async with read_engine.connect() as connection:
+                res = await connection.execute(
+                    text(
+                        "SELECT pg_last_wal_replay_lsn()::text, "
+                        "CASE WHEN pg_last_wal_receive_lsn() = "
+                        "pg_last_wal_replay_lsn() "
+                        "THEN 0 ELSE EXTRACT(EPOCH FROM now() - "
+                        "pg_last_xact_replay_timestamp()) END"
+                    )
+                )
+                replay_lsn, lag = res.one()
+        except Exception:
+            # an unreachable replica sends every read to the primary
+            self._replay_lsn, self._lag = None, None
+            return
+        self._replay_lsn = parse_lsn(replay_lsn) if replay_lsn else None
+        self._lag = float(lag) if lag is not None else None
+
+    async def use_replica(self, consistency_token: Optional[str]) -> bool:
+        if read_engine is None:
+            return False
+        await self._refresh_status()
+        if self._replay_lsn is None or self._lag is None or self._lag > self.max_lag:
+            return False
+        if consistency_token is None:
+            return True
+        try:
+            return self._replay_lsn >= parse_lsn(consistency_token)
+        except ValueError:
+            return False
+
+    def stats(self) -> dict:
+        return {
+            "enabled": read_engine is not None,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "replay_lag_seconds": self._lag,
+        }
+
+
+replica_router = ReplicaRouter(
+    status_ttl=settings.REPLICA_STATUS_TTL, max_lag=settings.REPLICA_MAX_LAG
+)
+
+
+async def get_consistency_token(db_session: AsyncSession) -> Optional[str]:
+    # only worth a round trip when reads can actually go elsewhere
+    if read_engine is None:
+        return None
+    res = await db_session.execute(text("SELECT pg_current_wal_lsn()::text"))
+    return res.scalar_one()
 
 
 #  dependency to create async session
 async def get_db() -> Generator:
+    init_engines()
     try:
         session: AsyncSession = async_session()
         yield session
     finally:
         await session.close()
+
+
+#  dependency to create async session for read-only endpoints
+async def get_db_read(request: Request) -> Generator:
+    init_engines()
+    consistency_token = request.headers.get(CONSISTENCY_TOKEN_HEADER)
+    if await replica_router.use_replica(consistency_token):
+        replica_router.replica_reads += 1
+        session_factory = async_read_session
+    else:
+        replica_router.primary_reads += 1
+        session_factory = async_session
+    try:
+        session: AsyncSession = session_factory()
+        yield session
+    finally:
+        await session.close()
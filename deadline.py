@@ -0,0 +1,121 @@
+from contextvars import ContextVar
+from logging import getLogger
+from math import isfinite
+from time import monotonic
+from typing import Optional
+
+from fastapi import Request
+from fastapi import status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+import settings
+
+logger = getLogger(__name__)
+
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+
+# postgres error code of a statement cancelled by statement_timeout
+QUERY_CANCELED_SQLSTATE = "57014"
+
+# monotonic time by which the current request has to be answered
+request_deadline: ContextVar[Optional[float]] = ContextVar(
+    "request_deadline", default=None
+)
+
+deadline_stats = {
+    "deadline_exceeded": 0,
+    "statement_timeouts": 0,
+    "checkout_timeouts": 0,
+}
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def remaining_time() -> Optional[float]:
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - monotonic()
+
+
+def bounded_timeout(timeout: float) -> float:
+    """Shrink `timeout` to what is left of the request budget."""
+    time_left = remaining_time()
+    if time_left is None:
+        return timeout
+    if time_left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(timeout, time_left)
+
+
+def _request_timeout(request: Request) -> float:
+    header = request.headers.get(REQUEST_TIMEOUT_HEADER)
+    if header is None:
+        return settings.REQUEST_TIMEOUT_SECONDS
+    timeout = float(header)
+    # nan and inf pass the comparisons below and would break every deadline
+    if not isfinite(timeout) or timeout <= 0:
+        raise ValueError(f"{REQUEST_TIMEOUT_HEADER} must be positive and finite")
+    # clients may ask for less time, never for more than the server allows
+    if settings.REQUEST_TIMEOUT_SECONDS > 0:
+        timeout = min(timeout, settings.REQUEST_TIMEOUT_SECONDS)
+    return timeout
+
+
+async def deadline_middleware(request: Request, call_next):
+    try:
+        timeout = _request_timeout(request)
+    except ValueError:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"detail": f"Invalid {REQUEST_TIMEOUT_HEADER} header"},
+        )
+    if timeout <= 0:
+        return await call_next(request)
+    token = request_deadline.set(monotonic() + timeout)
+    try:
+        return await call_next(request)
+    finally:
+        request_deadline.reset(token)
+
+
+##########################################
+#  Errors of requests that ran out of time #
+##########################################
+
+
+async def deadline_exceeded_handler(request: Request, err: DeadlineExceeded):
+    deadline_stats["deadline_exceeded"] += 1
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": "Request deadline exceeded"},
+    )
+
+
+async def pool_timeout_handler(request: Request, err: PoolTimeoutError):
+    time_left = remaining_time()
+    if time_left is not None and time_left <= 0:
+        # the checkout wait was cut short by the request budget
+        return await deadline_exceeded_handler(request, DeadlineExceeded(str(err)))
+    deadline_stats["checkout_timeouts"] += 1
+    logger.warning(f"Timed out waiting for a database connection: {err}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database is busy, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+async def statement_timeout_handler(request: Request, err: DBAPIError):
+    if getattr(err.orig, "sqlstate", None) != QUERY_CANCELED_SQLSTATE:
+        raise err
+    deadline_stats["statement_timeouts"] += 1
+    logger.warning(f"Database statement cancelled by the request deadline: {err}")
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": "Request deadline exceeded while querying the database"},
+    )
@@ -1,13 +1,221 @@
-from passlib.context import CryptContext
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+from statistics import median
+from time import perf_counter
+from typing import Optional
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import settings
+
+logger = getLogger(__name__)
+
+MIN_BCRYPT_ROUNDS = 4
+MAX_BCRYPT_ROUNDS = 16
+
+
+def build_pwd_context(rounds: int):
+    # passlib is imported on first use, it is only needed once someone logs in
+    from passlib.context import CryptContext
+
+    # hashes below the configured cost are reported by needs_update and
+    # rehashed lazily on the next login; stronger ones are left alone, so
+    # lowering BCRYPT_ROUNDS never triggers a wave of rehashes
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
+
+_pwd_context = None
+_rounds = settings.BCRYPT_ROUNDS
+
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        _pwd_context = build_pwd_context(_rounds)
+    return _pwd_context
+
+
+def configure_rounds(rounds: int):
+    global _pwd_context, _rounds
+    _rounds = rounds
+    _pwd_context = None
+
+
+def calibrate_bcrypt_rounds(target_ms: float, samples: int = 3) -> int:
+    """Return the highest bcrypt cost whose hash time on this host fits target_ms.
+
+    Each extra round doubles the work, so the scan stops at the first cost
+    that overshoots the budget.
+    """
+    chosen_rounds = MIN_BCRYPT_ROUNDS
+    for rounds in range(MIN_BCRYPT_ROUNDS, MAX_BCRYPT_ROUNDS + 1):
+        context = build_pwd_context(rounds)
+        timings = []
+        for _ in range(samples):
+            started_at = perf_counter()
+            context.hash("calibration-password")
+            timings.append((perf_counter() - started_at) * 1000)
+        if median(timings) > target_ms:
+            break
+        chosen_rounds = rounds
+    return chosen_rounds
 
 
 class Hasher:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str):
-        return pwd_context.verify(plain_password, hashed_password)
+        return get_pwd_context().verify(plain_password, hashed_password)
 
     @staticmethod
     def set_password_hashed(password: str) -> str:
-        return pwd_context.hash(password)
+        return get_pwd_context().hash(password)
+
+    @staticmethod
+    def needs_update(hashed_password: str) -> bool:
+        return get_pwd_context().needs_update(hashed_password)
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    return [Hasher.set_password_hashed(password) for password in passwords]
+
+
+class HashingQueueFull(Exception):
+    pass
+
+
+async def hashing_queue_full_handler(request, err: HashingQueueFull):
+    # fastapi is imported here, the pool's worker processes import this module
+    from fastapi import status
+    from fastapi.responses import JSONResponse
+
+    logger.warning(err)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(err)},
+        headers={"Retry-After": "1"},
+    )
+
+
+####################################################
+# Async hashing service backed by a process pool #
+####################################################
+
+
+class AsyncHasher:
+    """Run bcrypt in worker processes so it never blocks the event loop.
+
+    At most `max_queue_depth` operations may be in flight (running or waiting
+    for a free worker); anything above that is rejected with HashingQueueFull
+    so callers can shed load instead of piling up behind the pool.
+    """
+
+    def __init__(self, max_workers: int, max_queue_depth: int, rounds: int):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.rounds = rounds
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._counters = {
+            "hashed": 0,
+            "verified": 0,
+            "rejected": 0,
+            "failed": 0,
+        }
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # the pool is created on first use so importing the module stays cheap
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=configure_rounds,
+                initargs=(self.rounds,),
+            )
+        return self._executor
+
+    async def _run(self, counter: str, func, *args, operations: int = 1):
+        if self._in_flight >= self.max_queue_depth:
+            self._counters["rejected"] += 1
+            raise HashingQueueFull(
+                f"Hashing queue is full ({self.max_queue_depth} in flight)"
+            )
+        self._in_flight += 1
+        started_at = perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_executor(), func, *args)
+        except Exception:
+            self._counters["failed"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+        elapsed = perf_counter() - started_at
+        self._counters[counter] += operations
+        self._total_seconds += elapsed
+        self._max_seconds = max(self._max_seconds, elapsed)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hashed", Hasher.set_password_hashed, password)
+
+    async def hash_many(self, passwords: list[str]) -> list[str]:
+        """Hash a batch split into one chunk per worker, keeping the order.
+
+        Each chunk takes a single slot of the queue, so large batches don't
+        crowd out logins.
+        """
+        chunk_size = -(-len(passwords) // self.max_workers) or 1
+        chunks = [
+            passwords[start : start + chunk_size]
+            for start in range(0, len(passwords), chunk_size)
+        ]
+        hashed_chunks = await asyncio.gather(
+            *(
+                self._run("hashed", hash_passwords, chunk, operations=len(chunk))
+                for chunk in chunks
+            )
+        )
+        return [hashed for chunk in hashed_chunks for hashed in chunk]
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(
+            "verified", Hasher.verify_password, plain_password, hashed_password
+        )
+
+    def stats(self) -> dict:
+        completed = self._counters["hashed"] + self._counters["verified"]
+        return {
+            "rounds": self.rounds,
+            "workers": self.max_workers,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self._in_flight,
+            **self._counters,
+            "avg_seconds": self._total_seconds / completed if completed else 0.0,
+            "max_seconds": self._max_seconds,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+async_hasher = AsyncHasher(
+    max_workers=settings.HASHING_POOL_WORKERS,
+    max_queue_depth=settings.HASHING_MAX_QUEUE_DEPTH,
+    rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+if __name__ == "__main__":
+    # run once per host class and put the result into the environment, every
+    # worker then hashes with the same cost
+    print(
+        f"BCRYPT_ROUNDS={calibrate_bcrypt_rounds(settings.HASHING_TARGET_MS)}"
+        f"  # target {settings.HASHING_TARGET_MS} ms"
+    )
@@ -0,0 +1,154 @@
+import codecs
+import csv
+import json
+from enum import Enum
+from logging import getLogger
+from time import perf_counter
+from typing import AsyncIterator
+from typing import Callable
+from uuid import uuid4
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+import settings
+from api.schemas import ImportUser
+from db.crud import UserCRUD
+from hashing import async_hasher
+
+logger = getLogger(__name__)
+
+
+class ImportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.rejected = 0
+        self._started_at = perf_counter()
+
+    def as_dict(self) -> dict:
+        seconds = perf_counter() - self._started_at
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else 0.0,
+        }
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a stream of bytes into text lines without reading it whole."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _parse_line(line: str, import_format: ImportFormat, header: list[str]) -> dict:
+    if import_format == ImportFormat.NDJSON:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError("Row should be a JSON object")
+        return record
+    values = next(csv.reader([line]))
+    if len(values) != len(header):
+        raise ValueError(f"Row should have {len(header)} columns")
+    # empty cells mean "not provided", e.g. the unused password column
+    return {column: value for column, value in zip(header, values) if value != ""}
+
+
+def _validate(record: dict) -> ImportUser:
+    try:
+        return ImportUser(**record)
+    except HTTPException as err:
+        # the CreateUser name rules report through HTTPException
+        raise ValueError(err.detail)
+    except ValidationError as err:
+        raise ValueError(
+            "; ".join(
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                for error in err.errors()
+            )
+        )
+
+
+async def _load_chunk(
+    chunk: list[tuple[int, ImportUser]], db_session, stats: ImportStats, on_reject
+):
+    # plaintext passwords are hashed across the worker pool, hashes are kept
+    plaintext = [user.password for _, user in chunk if user.hashed_password is None]
+    hashed = iter(await async_hasher.hash_many(plaintext)) if plaintext else iter(())
+    users = [
+        (
+            uuid4(),
+            user.name,
+            user.surname,
+            user.email,
+            user.hashed_password or next(hashed),
+        )
+        for _, user in chunk
+    ]
+    async with db_session.begin():
+        user_crud = UserCRUD(db_session)
+        imported_ids = await user_crud.copy_users(users)
+    stats.imported += len(imported_ids)
+    for (line_number, _), user in zip(chunk, users):
+        if user[0] not in imported_ids:
+            stats.rejected += 1
+            on_reject(line_number, user[3], "User with this email already exists")
+
+
+async def import_users(
+    lines: AsyncIterator[str],
+    import_format: ImportFormat,
+    db_session,
+    on_reject: Callable[[int, str, str], None],
+) -> ImportStats:
+    """Validate, hash and load users read from `lines` chunk by chunk.
+
+    Every chunk of USER_IMPORT_CHUNK_SIZE valid rows is loaded in its own
+    transaction, so memory use stays flat and an interrupted import keeps
+    the chunks already merged. Invalid rows and taken emails are passed to
+    `on_reject(line_number, email, reason)`.
+    """
+    stats = ImportStats()
+    header = None
+    chunk = []
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        line = line.strip()
+        if not line:
+            continue
+        if import_format == ImportFormat.CSV and header is None:
+            header = next(csv.reader([line]))
+            continue
+        stats.rows += 1
+        record = None
+        try:
+            record = _parse_line(line, import_format, header)
+            user = _validate(record)
+        except (ValueError, csv.Error) as err:
+            stats.rejected += 1
+            on_reject(line_number, record.get("email") if record else None, str(err))
+            continue
+        chunk.append((line_number, user))
+        if len(chunk) >= settings.USER_IMPORT_CHUNK_SIZE:
+            await _load_chunk(chunk, db_session, stats, on_reject)
+            chunk = []
+    if chunk:
+        await _load_chunk(chunk, db_session, stats, on_reject)
+    logger.info(f"User import finished: {stats.as_dict()}")
+    return stats
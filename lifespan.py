@@ -0,0 +1,106 @@
+import asyncio
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from logging import getLogger
+from time import monotonic
+from time import perf_counter
+from time import process_time
+
+import settings
+from api.handlers.auth import _warm_up_principal_cache
+from archiver import run_archival
+from db import session
+from db.crud import principal_cache
+from hashing import async_hasher
+from revocation import revocation_list
+
+logger = getLogger(__name__)
+
+# milliseconds spent in every startup step, served by /service/metrics
+startup_report = {}
+
+
+@contextmanager
+def _timed_step(name: str):
+    started_at = perf_counter()
+    try:
+        yield
+    finally:
+        startup_report[name] = round((perf_counter() - started_at) * 1000, 2)
+
+
+async def _sync_revocation_list(session_factory):
+    purged_at = monotonic()
+    while True:
+        await asyncio.sleep(settings.REVOCATION_SYNC_SECONDS)
+        try:
+            async with session_factory() as db_session:
+                await revocation_list.sync(db_session)
+                if monotonic() - purged_at >= settings.REVOCATION_PURGE_SECONDS:
+                    purged_at = monotonic()
+                    purged = await revocation_list.purge_expired(db_session)
+                    logger.info(f"Deleted {purged} expired revoked tokens")
+        except Exception as err:
+            logger.warning(f"Couldn't sync revoked tokens: {err}")
+
+
+async def _startup(session_factory) -> list[asyncio.Task]:
+    with _timed_step("engines_ms"):
+        session.init_engines()
+
+    # the pre-warmed pool only serves the default session factory
+    if session_factory is session.async_session:
+        with _timed_step("pool_prewarm_ms"):
+            try:
+                warm_connections = await session.prewarm_pool(settings.DB_POOL_PREWARM)
+                startup_report["pool_prewarmed_connections"] = warm_connections
+            except Exception as err:
+                logger.error(f"Couldn't pre-warm the connection pool: {err}")
+
+    with _timed_step("revocation_list_ms"):
+        try:
+            async with session_factory() as db_session:
+                revoked_count = await revocation_list.rebuild(db_session)
+            logger.info(f"Loaded {revoked_count} revoked tokens")
+        except Exception as err:
+            logger.error(f"Couldn't load revoked tokens: {err}")
+
+    if principal_cache.enabled and settings.PRINCIPAL_CACHE_WARMUP:
+        with _timed_step("principal_cache_ms"):
+            async with session_factory() as db_session:
+                users = await _warm_up_principal_cache(
+                    settings.PRINCIPAL_CACHE_WARMUP, db_session
+                )
+        logger.info(f"Principal cache warmed up with {len(users)} users")
+
+    background_tasks = []
+    if settings.REVOCATION_SYNC_SECONDS > 0:
+        background_tasks.append(
+            asyncio.create_task(_sync_revocation_list(session_factory))
+        )
+    if settings.USER_ARCHIVE_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_archival(session_factory)))
+    return background_tasks
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Prepare the worker before it accepts traffic and release it on shutdown.
+
+    Startup and background jobs open their sessions through
+    `app.state.session_factory` when it is set, tests point it at their database.
+    """
+    session_factory = getattr(app.state, "session_factory", session.async_session)
+    started_at = perf_counter()
+    cpu_started_at = process_time()
+    background_tasks = await _startup(session_factory)
+    startup_report["total_ms"] = round((perf_counter() - started_at) * 1000, 2)
+    startup_report["cpu_ms"] = round((process_time() - cpu_started_at) * 1000, 2)
+    logger.info(f"Worker ready: {startup_report}")
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        async_hasher.shutdown()
+        await session.dispose_engines()
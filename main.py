@@ -1,14 +1,43 @@
+from logging import getLogger
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.routing import APIRouter
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
+from admission import admission_middleware
 from api.routes.auth import login_router
+from api.routes.service import service_router
 from api.routes.user import user_router
+from deadline import deadline_exceeded_handler
+from deadline import deadline_middleware
+from deadline import DeadlineExceeded
+from deadline import pool_timeout_handler
+from deadline import statement_timeout_handler
+from hashing import hashing_queue_full_handler
+from hashing import HashingQueueFull
+from lifespan import lifespan
+
 
+logger = getLogger(__name__)
 
 """ API ROUTERS """
 
 app = FastAPI(title="plygramm-uni")
+# engines, pool pre-warm and caches are set up here instead of at import time
+app.router.lifespan_context = lifespan
+
+# requests over the adaptive concurrency limit are queued or shed, the wait
+# for admission counts against the deadline set by the outer middleware
+app.middleware("http")(admission_middleware)
+# every request gets a time budget that bounds its database work
+app.middleware("http")(deadline_middleware)
+app.add_exception_handler(DeadlineExceeded, deadline_exceeded_handler)
+app.add_exception_handler(PoolTimeoutError, pool_timeout_handler)
+app.add_exception_handler(DBAPIError, statement_timeout_handler)
+# the bcrypt pool is saturated, clients are asked to retry shortly
+app.add_exception_handler(HashingQueueFull, hashing_queue_full_handler)
 
 # create instanse for the routers
 main_api_router = APIRouter()
@@ -16,7 +45,9 @@ main_api_router = APIRouter()
 # set routers to the app instance
 main_api_router.include_router(user_router, prefix="/user", tags=["user"])
 main_api_router.include_router(login_router, prefix="/login", tags=["login"])
+main_api_router.include_router(service_router, prefix="/service", tags=["service"])
 app.include_router(main_api_router)
 
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
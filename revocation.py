@@ -0,0 +1,127 @@
+from hashlib import sha256
+from math import ceil
+from math import log
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import settings
+from db.crud import RevokedTokenCRUD
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` items at `error_rate`."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = ceil(-capacity * log(error_rate) / log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * log(2)))
+        self._bits = bytearray(ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, item: str):
+        # double hashing: k positions out of two 64 bit halves of one digest
+        digest = sha256(item.encode()).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:16], "big") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+#################################################
+# In-memory view of the revoked_tokens table #
+#################################################
+
+
+class RevocationList:
+    """Bloom filter over revoked token ids, backed by the revoked_tokens table.
+
+    A negative answer is final; a positive one has to be confirmed with
+    RevokedTokenCRUD.is_token_revoked. Other workers' revocations arrive
+    through `sync`, which reads the rows after the highest database id seen
+    so far; local revocations never move that watermark.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = BloomFilter(capacity, error_rate)
+        self._last_id: Optional[int] = None
+        self.checks = 0
+        self.positives = 0
+        self.purged = 0
+
+    def add(self, jti: str):
+        self._filter.add(jti)
+
+    def _load(self, revoked_tokens: list[tuple[int, str]]):
+        for revoked_id, jti in revoked_tokens:
+            # rows of the overlap window are read again, keep the count honest
+            if jti not in self._filter:
+                self._filter.add(jti)
+            if self._last_id is None or revoked_id > self._last_id:
+                self._last_id = revoked_id
+
+    def might_be_revoked(self, jti: str) -> bool:
+        self.checks += 1
+        if jti in self._filter:
+            self.positives += 1
+            return True
+        return False
+
+    async def rebuild(self, db_session: AsyncSession) -> int:
+        async with db_session.begin():
+            revoked_tokens = await RevokedTokenCRUD(db_session).get_revoked_tokens()
+        # expired ids drop out of the filter only when it is rebuilt
+        self._filter = BloomFilter(
+            max(self.capacity, 2 * len(revoked_tokens)), self.error_rate
+        )
+        self._last_id = None
+        self._load(revoked_tokens)
+        return len(revoked_tokens)
+
+    async def sync(self, db_session: AsyncSession) -> int:
+        if self._filter.count >= self._filter.capacity:
+            return await self.rebuild(db_session)
+        async with db_session.begin():
+            revoked_tokens = await RevokedTokenCRUD(db_session).get_revoked_tokens(
+                after_id=self._last_id,
+                overlap_seconds=settings.REVOCATION_SYNC_OVERLAP_SECONDS,
+            )
+        self._load(revoked_tokens)
+        return len(revoked_tokens)
+
+    async def purge_expired(self, db_session: AsyncSession) -> int:
+        # expired ids stay in the filter until the next rebuild, their
+        # tokens fail validation before the filter is asked
+        async with db_session.begin():
+            purged = await RevokedTokenCRUD(db_session).delete_expired_tokens()
+        self.purged += purged
+        return purged
+
+    def stats(self) -> dict:
+        return {
+            "size": self._filter.count,
+            "capacity": self._filter.capacity,
+            "bits": self._filter.size,
+            "hash_count": self._filter.hash_count,
+            "checks": self.checks,
+            "positives": self.positives,
+            "purged": self.purged,
+        }
+
+
+revocation_list = RevocationList(
+    capacity=settings.REVOCATION_BLOOM_CAPACITY,
+    error_rate=settings.REVOCATION_BLOOM_ERROR_RATE,
+)
@@ -1,10 +1,21 @@
 from datetime import datetime
 from datetime import timedelta
+from hashlib import sha256
 from typing import Optional
-
-from jose import jwt
+from uuid import uuid4
 
 import settings
+from cache import TTLCache
+
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+# decoded claims of already verified tokens, kept until the token expires
+token_cache = TTLCache(max_size=settings.TOKEN_CACHE_MAX_SIZE)
+
+
+class InvalidTokenError(Exception):
+    pass
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -15,6 +26,59 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expires_at = datetime.utcnow() + timedelta(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
+    # every token gets an id so it can be revoked individually
+    data_to_encode.setdefault("jti", uuid4().hex)
     data_to_encode.update({"exp": expires_at})
+    # jose (and its crypto backends) is imported on first use to keep startup fast
+    from jose import jwt
+
     encoded_jwt = jwt.encode(data_to_encode, settings.SECRET_KEY, settings.ALGORITHM)
     return encoded_jwt
+
+
+def create_refresh_token(email: str):
+    return create_access_token(
+        data={"sub": email, "type": REFRESH_TOKEN_TYPE},
+        expires_delta=timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+
+
+def build_access_token_claims(user) -> dict:
+    claims = {"sub": user.email}
+    if settings.TOKEN_EMBED_PRINCIPAL:
+        claims.update(
+            {
+                "uid": str(user.user_id),
+                "roles": list(user.roles),
+                "sv": user.security_version,
+            }
+        )
+    return claims
+
+
+def _token_cache_key(token: str) -> bytes:
+    # never keep raw bearer tokens in memory longer than the request
+    return sha256(token.encode()).digest()
+
+
+def decode_token(token: str) -> dict:
+    """Verify the token signature and claims, reusing earlier verifications.
+
+    Raises InvalidTokenError when the token is invalid or expired.
+    """
+    cache_key = _token_cache_key(token)
+    payload = token_cache.get(cache_key)
+    if payload is None:
+        from jose import JWTError
+        from jose import jwt
+
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, [settings.ALGORITHM])
+        except JWTError as err:
+            raise InvalidTokenError(str(err)) from err
+        token_cache.set(cache_key, payload, expires_at=payload.get("exp"))
+    return payload
+
+
+def invalidate_token(token: str):
+    token_cache.invalidate(_token_cache_key(token))
@@ -1,43 +1,165 @@
 """ File config and settings to the project """
+import os
+
 from dotenv import load_dotenv
 from envparse import Env
 
 env = Env()
 load_dotenv()
 
-HOME_DIRECTORY = env.str("HOME_DIRECTORY")
 
-DB_HOST = env.str("DB_HOST")
+def _database_url(kind: str) -> str:
+    database_url = env.str(f"{kind}_DATABASE_URL", default="")
+    if database_url:
+        return database_url
+    return (
+        f"postgresql+asyncpg://{env.str(f'DB_USER_{kind}')}"
+        f":{env.str(f'DB_PASS_{kind}')}"
+        f"@{env.str('DB_HOST')}:{env.str(f'DB_PORT_{kind}')}"
+        f"/{env.str(f'DB_NAME_{kind}')}"
+    )
 
-DB_PORT_PROD = env.str("DB_PORT_PROD")
-DB_NAME_PROD = env.str("DB_NAME_PROD")
-DB_USER_PROD = env.str("DB_USER_PROD")
-DB_PASS_PROD = env.str("DB_PASS_PROD")
 
+# Settings without a default are read on first access (see __getattr__ below),
+# so importing this module doesn't require the variables of code paths that
+# never run, e.g. the test database in production.
+_LAZY_SETTINGS = {
+    "HOME_DIRECTORY": lambda: env.str("HOME_DIRECTORY"),
+    "DB_HOST": lambda: env.str("DB_HOST"),
+    **{
+        f"DB_{part}_{kind}": (lambda name: lambda: env.str(name))(f"DB_{part}_{kind}")
+        for part in ("PORT", "NAME", "USER", "PASS")
+        for kind in ("PROD", "TEST")
+    },
+    # connect string to main database
+    "PROD_DATABASE_URL": lambda: _database_url("PROD"),
+    # connect string to test database
+    "TEST_DATABASE_URL": lambda: _database_url("TEST"),
+    "SECRET_KEY": lambda: env.str("SECRET_KEY"),
+}
 
-# connect string to main database
-PROD_DATABASE_URL = env.str(
-    "PROD_DATABASE_URL",
-    default=f"postgresql+asyncpg://{DB_USER_PROD}:{DB_PASS_PROD}"
-    f"@{DB_HOST}:{DB_PORT_PROD}"
-    f"/{DB_NAME_PROD}",
-)
+
+def __getattr__(name: str):
+    if name not in _LAZY_SETTINGS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = _LAZY_SETTINGS[name]()
+    globals()[name] = value
+    return value
 
 
-# connect string to test database
-DB_PORT_TEST = env.str("DB_PORT_TEST")
-DB_NAME_TEST = env.str("DB_NAME_TEST")
-DB_USER_TEST = env.str("DB_USER_TEST")
-DB_PASS_TEST = env.str("DB_PASS_TEST")
+# connection pool of the main database, size it against max_connections
+DB_POOL_SIZE = env.int("DB_POOL_SIZE", default=5)
+DB_MAX_OVERFLOW = env.int("DB_MAX_OVERFLOW", default=10)
+DB_POOL_TIMEOUT = env.float("DB_POOL_TIMEOUT", default=30.0)
+DB_POOL_RECYCLE = env.int("DB_POOL_RECYCLE", default=-1)
+DB_POOL_PRE_PING = env.bool("DB_POOL_PRE_PING", default=False)
+DB_ECHO = env.bool("DB_ECHO", default=False)
+# default time budget of a request, bounds pool checkouts and statement_timeout;
+# clients may lower it with the X-Request-Timeout header, 0 turns it off
+REQUEST_TIMEOUT_SECONDS = env.float("REQUEST_TIMEOUT_SECONDS", default=30.0)
+# connections are opened with statement_timeout = REQUEST_TIMEOUT_SECONDS;
+# this narrows it to what is left of each request's budget, at the cost of
+# one SET LOCAL round trip per transaction
+DB_DEADLINE_STATEMENT_TIMEOUT = env.bool("DB_DEADLINE_STATEMENT_TIMEOUT", default=False)
+# connections opened by the lifespan hook before the worker reports ready
+DB_POOL_PREWARM = env.int("DB_POOL_PREWARM", default=0)
 
-TEST_DATABASE_URL = env.str(
-    "TEST_DATABASE_URL",
-    default=f"postgresql+asyncpg://{DB_USER_TEST}:{DB_PASS_TEST}"
-    f"@{DB_HOST}:{DB_PORT_TEST}"
-    f"/{DB_NAME_TEST}",
+# admission control of /user and /login requests: requests over the
+# concurrency limit wait in a queue of ADMISSION_QUEUE_SIZE, the rest get 503.
+# The limit adapts to the observed latency (AIMD)
+ADMISSION_CONTROL = env.bool("ADMISSION_CONTROL", default=True)
+ADMISSION_INITIAL_LIMIT = env.int(
+    "ADMISSION_INITIAL_LIMIT", default=DB_POOL_SIZE + DB_MAX_OVERFLOW
 )
+ADMISSION_MIN_LIMIT = env.int("ADMISSION_MIN_LIMIT", default=1)
+ADMISSION_MAX_LIMIT = env.int("ADMISSION_MAX_LIMIT", default=200)
+ADMISSION_QUEUE_SIZE = env.int("ADMISSION_QUEUE_SIZE", default=100)
+ADMISSION_QUEUE_TIMEOUT = env.float("ADMISSION_QUEUE_TIMEOUT", default=1.0)
+ADMISSION_LATENCY_TARGET_MS = env.float("ADMISSION_LATENCY_TARGET_MS", default=1000)
+ADMISSION_BACKOFF = env.float("ADMISSION_BACKOFF", default=0.9)
+ADMISSION_RETRY_AFTER = env.int("ADMISSION_RETRY_AFTER", default=1)
+
+# optional streaming replica for read-only endpoints
+REPLICA_DATABASE_URL = env.str("REPLICA_DATABASE_URL", default="")
+# replicas lagging behind more than REPLICA_MAX_LAG seconds aren't used
+REPLICA_MAX_LAG = env.float("REPLICA_MAX_LAG", default=1.0)
+REPLICA_STATUS_TTL = env.float("REPLICA_STATUS_TTL", default=0.5)
+
+# max users per POST or PUT /user/batch request, every one costs a bcrypt hash
+USER_BATCH_MAX_SIZE = env.int("USER_BATCH_MAX_SIZE", default=100)
+
+# max ids resolved by one POST /user/lookup request
+USER_LOOKUP_MAX_IDS = env.int("USER_LOOKUP_MAX_IDS", default=1000)
+
+# page size of GET /user/list
+USER_LIST_DEFAULT_PAGE_SIZE = env.int("USER_LIST_DEFAULT_PAGE_SIZE", default=50)
+USER_LIST_MAX_PAGE_SIZE = env.int("USER_LIST_MAX_PAGE_SIZE", default=500)
+
+# rows fetched from the server-side cursor per chunk of GET /user/export
+USER_EXPORT_CHUNK_SIZE = env.int("USER_EXPORT_CHUNK_SIZE", default=1000)
+
+# rows validated, hashed and COPYed per transaction of a bulk import
+USER_IMPORT_CHUNK_SIZE = env.int("USER_IMPORT_CHUNK_SIZE", default=1000)
+
+# deactivated users older than USER_ARCHIVE_AFTER_DAYS are moved to
+# users_archive in batches, pausing between them; an interval of 0 leaves
+# the job to `python cli.py archive-users`
+USER_ARCHIVE_AFTER_DAYS = env.int("USER_ARCHIVE_AFTER_DAYS", default=90)
+USER_ARCHIVE_BATCH_SIZE = env.int("USER_ARCHIVE_BATCH_SIZE", default=500)
+USER_ARCHIVE_PAUSE_SECONDS = env.float("USER_ARCHIVE_PAUSE_SECONDS", default=0.1)
+USER_ARCHIVE_INTERVAL_SECONDS = env.int("USER_ARCHIVE_INTERVAL_SECONDS", default=0)
+
+# single-row user lookups run as prepared statements on the raw asyncpg
+# connection and return frozen read models instead of ORM objects
+USER_LOOKUP_FAST_PATH = env.bool("USER_LOOKUP_FAST_PATH", default=False)
+
+# concurrent lookups of users share one in-flight ANY($1) query, the batch
+# collects keys for the window in seconds (0 waits a single event loop tick)
+USER_LOOKUP_COALESCING = env.bool("USER_LOOKUP_COALESCING", default=False)
+USER_LOOKUP_COALESCING_WINDOW = env.float("USER_LOOKUP_COALESCING_WINDOW", default=0.0)
 
 
 ACCESS_TOKEN_EXPIRE_MINUTES = env.str("ACCESS_TOKEN_EXPIRE_MINUTES", default=30)
-SECRET_KEY = env.str("SECRET_KEY")
+REFRESH_TOKEN_EXPIRE_DAYS = env.int("REFRESH_TOKEN_EXPIRE_DAYS", default=14)
 ALGORITHM = env.str("ALGORITHM", default="HS256")
+# max number of verified tokens kept in memory, 0 turns the cache off
+TOKEN_CACHE_MAX_SIZE = env.int("TOKEN_CACHE_MAX_SIZE", default=10000)
+
+
+# password hashing runs in a separate process pool
+HASHING_POOL_WORKERS = env.int("HASHING_POOL_WORKERS", default=os.cpu_count() or 1)
+HASHING_MAX_QUEUE_DEPTH = env.int("HASHING_MAX_QUEUE_DEPTH", default=64)
+
+# bcrypt cost; `python hashing.py` prints the highest cost that fits
+# HASHING_TARGET_MS per hash/verify on the current host
+BCRYPT_ROUNDS = env.int("BCRYPT_ROUNDS", default=12)
+HASHING_TARGET_MS = env.int("HASHING_TARGET_MS", default=250)
+
+# cache of users looked up on the auth path, 0 turns it off. Every worker
+# keeps its own copy, so the TTL bounds staleness across workers
+PRINCIPAL_CACHE_MAX_SIZE = env.int("PRINCIPAL_CACHE_MAX_SIZE", default=0)
+PRINCIPAL_CACHE_TTL = env.float("PRINCIPAL_CACHE_TTL", default=30.0)
+# emails of principals loaded into the cache on startup
+PRINCIPAL_CACHE_WARMUP = env.list("PRINCIPAL_CACHE_WARMUP", default=[])
+
+# embed user_id, roles and security version into access tokens so that
+# authenticated requests don't need to load the user from the database
+TOKEN_EMBED_PRINCIPAL = env.bool("TOKEN_EMBED_PRINCIPAL", default=False)
+# how long a worker trusts a cached security version of another worker's user
+SECURITY_VERSION_TTL = env.float("SECURITY_VERSION_TTL", default=5.0)
+SECURITY_VERSION_CACHE_MAX_SIZE = env.int(
+    "SECURITY_VERSION_CACHE_MAX_SIZE", default=100000
+)
+
+# revoked token ids are checked against an in-memory Bloom filter which is
+# loaded from the revoked_tokens table and synced every few seconds
+REVOCATION_BLOOM_CAPACITY = env.int("REVOCATION_BLOOM_CAPACITY", default=100000)
+REVOCATION_BLOOM_ERROR_RATE = env.float("REVOCATION_BLOOM_ERROR_RATE", default=0.001)
+REVOCATION_SYNC_SECONDS = env.float("REVOCATION_SYNC_SECONDS", default=10.0)
+# rows revoked this recently are re-read by every sync; has to exceed the
+# sync interval plus the longest transaction that revokes tokens
+REVOCATION_SYNC_OVERLAP_SECONDS = env.float(
+    "REVOCATION_SYNC_OVERLAP_SECONDS", default=60.0
+)
+# expired rows are deleted from revoked_tokens this often by the sync loop
+REVOCATION_PURGE_SECONDS = env.float("REVOCATION_PURGE_SECONDS", default=3600.0)
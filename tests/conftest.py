@@ -15,6 +15,7 @@ from starlette.testclient import TestClient
 import settings
 from db.models import UserRole
 from db.session import get_db
+from db.session import get_db_read
 from main import app
 from security import create_access_token
 from settings import HOME_DIRECTORY
@@ -22,6 +23,8 @@ from settings import HOME_DIRECTORY
 
 CLEAN_TABLES = [
     "users",
+    "users_archive",
+    "revoked_tokens",
 ]
 
 
@@ -34,6 +37,12 @@ def event_loop():
 
 @pytest_asyncio.fixture(scope="session", autouse=True)
 async def run_migrations():
+    # extensions aren't part of the autogenerated migrations
+    connection = await asyncpg.connect(
+        "".join(settings.TEST_DATABASE_URL.split("+asyncpg"))
+    )
+    await connection.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    await connection.close()
     os.chdir(f"{HOME_DIRECTORY}/tests")
     os.system(f"{HOME_DIRECTORY}/venv/bin/alembic --version")
     # uncomment while first run
@@ -85,6 +94,13 @@ async def client() -> Generator[TestClient, Any, None]:
             pass
 
     app.dependency_overrides[get_db] = _get_test_db
+    app.dependency_overrides[get_db_read] = _get_test_db
+    # startup steps and background jobs of the lifespan use the test database too
+    app.state.session_factory = sessionmaker(
+        create_async_engine(settings.TEST_DATABASE_URL, future=True),
+        expire_on_commit=False,
+        class_=AsyncSession,
+    )
     with TestClient(app) as client:
         yield client
 
@@ -0,0 +1,37 @@
+from uuid import uuid4
+
+import pytest
+
+from admission import admission_controller
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+@pytest.fixture
+def saturated_workers(monkeypatch):
+    monkeypatch.setattr(admission_controller, "limit", 0.0)
+    monkeypatch.setattr(admission_controller, "max_queue", 0)
+
+
+async def test_get_user_shed_when_saturated(
+    client, create_user_in_database, saturated_workers
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Sigurd",
+        "surname": "Ragnarsson",
+        "email": "sigurd_ragnarsson@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    shed_before = admission_controller.shed
+    resp = client.get(
+        f'/user/?user_id={user_data["user_id"]}',
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    assert admission_controller.shed == shed_before + 1
+    assert client.get("/service/metrics").status_code == 200
@@ -0,0 +1,93 @@
+from datetime import datetime
+from datetime import timedelta
+from uuid import uuid4
+
+from archiver import archive_inactive_users
+from archiver import archive_stats
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_archive_and_restore_user(
+    client,
+    async_session_test,
+    asyncpg_pool,
+    create_user_in_database,
+    get_user_from_database,
+):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Ragnar",
+        "surname": "Lothbrok",
+        "email": "ragnar_king@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+    }
+    old_user = {
+        "user_id": uuid4(),
+        "name": "Ecbert",
+        "surname": "Wessex",
+        "email": "ecbert_king@wessex.com",
+        "is_active": False,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    recent_user = {
+        "user_id": uuid4(),
+        "name": "Aethelwulf",
+        "surname": "Wessex",
+        "email": "aethelwulf_king@wessex.com",
+        "is_active": False,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    for user_data in [admin_data, old_user, recent_user]:
+        await create_user_in_database(**user_data)
+    async with asyncpg_pool.acquire() as connection:
+        for user_data, days in [(old_user, 400), (recent_user, 1)]:
+            await connection.execute(
+                "UPDATE users SET deactivated_at = $2 WHERE user_id = $1",
+                user_data["user_id"],
+                datetime.utcnow() - timedelta(days=days),
+            )
+
+    archived = await archive_inactive_users(
+        async_session_test, older_than_days=90, batch_size=1, pause=0
+    )
+    assert archived == 1
+    assert archive_stats["last_run_archived"] == 1
+    assert await get_user_from_database(old_user["user_id"]) == []
+    assert len(await get_user_from_database(recent_user["user_id"])) == 1
+
+    headers = create_test_auth_headers_for_user(admin_data["email"])
+    resp = client.post(f'/user/restore?user_id={old_user["user_id"]}', headers=headers)
+    assert resp.status_code == 200
+    assert resp.json() == {"updated_user_id": str(old_user["user_id"])}
+    users_from_db = await get_user_from_database(old_user["user_id"])
+    assert dict(users_from_db[0])["is_active"] is True
+    assert dict(users_from_db[0])["deactivated_at"] is None
+    resp = client.post(f'/user/restore?user_id={old_user["user_id"]}', headers=headers)
+    assert resp.status_code == 404
+
+
+async def test_delete_user_sets_deactivated_at(
+    client, create_user_in_database, get_user_from_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Athelstan",
+        "surname": "Monk",
+        "email": "athelstan_monk@lindisfarne.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.delete(
+        f'/user/?user_id={user_data["user_id"]}',
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 200
+    users_from_db = await get_user_from_database(user_data["user_id"])
+    assert dict(users_from_db[0])["deactivated_at"] is not None
@@ -1,6 +1,26 @@
 import json
+from uuid import uuid4
 
 import pytest
+import pytest_asyncio
+
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+@pytest_asyncio.fixture
+async def admin_headers(create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Ragnar",
+        "surname": "Lothbrok",
+        "email": "ragnar_king@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    return create_test_auth_headers_for_user(admin_data["email"])
 
 
 async def test_create_user(client, get_user_from_database):
@@ -132,3 +152,121 @@ async def test_create_user_validation_error(
     assert resp.status_code == expected_status_code
     resp_data = resp.json()
     assert resp_data == expected_detail
+
+
+async def test_create_users_batch(client, get_user_from_database, admin_headers):
+    users_data = [
+        {
+            "name": "Bjorn",
+            "surname": "Ironside",
+            "email": "bjorn_ironside@clan.com",
+            "password": "Test2373",
+        },
+        {
+            "name": "Hvitserk",
+            "surname": "Ragnarsson",
+            "email": "hvitserk@clan.com",
+            "password": "Test2374",
+        },
+    ]
+    resp = client.post(
+        "/user/batch", data=json.dumps(users_data), headers=admin_headers
+    )
+    data_from_resp = resp.json()
+    assert resp.status_code == 200
+    assert data_from_resp["created"] == 2
+    assert data_from_resp["conflicts"] == 0
+    for user_data, result in zip(users_data, data_from_resp["results"]):
+        assert result["status"] == "created"
+        assert result["email"] == user_data["email"]
+        assert result["user"]["name"] == user_data["name"]
+        assert result["user"]["is_active"] is True
+        users_from_db = await get_user_from_database(result["user"]["user_id"])
+        assert len(users_from_db) == 1
+        assert dict(users_from_db[0])["hashed_password"] != user_data["password"]
+
+
+async def test_create_users_batch_duplicate_mail(client, admin_headers):
+    user_data = {
+        "name": "Aslaug",
+        "surname": "Queen",
+        "email": "aslaug_queen@clan.com",
+        "password": "Test2373",
+    }
+    resp = client.post("/user/", data=json.dumps(user_data))
+    assert resp.status_code == 200
+    users_data = [
+        {**user_data, "name": "Lagertha"},
+        {
+            "name": "Gunnhild",
+            "surname": "Shieldmaiden",
+            "email": "gunnhild@clan.com",
+            "password": "Test2375",
+        },
+        {
+            "name": "Torvi",
+            "surname": "Shieldmaiden",
+            "email": "gunnhild@clan.com",
+            "password": "Test2376",
+        },
+    ]
+    resp = client.post(
+        "/user/batch", data=json.dumps(users_data), headers=admin_headers
+    )
+    data_from_resp = resp.json()
+    assert resp.status_code == 200
+    assert data_from_resp["created"] == 1
+    assert data_from_resp["conflicts"] == 2
+    assert [result["status"] for result in data_from_resp["results"]] == [
+        "conflict",
+        "created",
+        "conflict",
+    ]
+    assert data_from_resp["results"][0]["user"] is None
+    assert data_from_resp["results"][1]["user"]["name"] == "Gunnhild"
+
+
+@pytest.mark.parametrize("users_count", [0, 101])
+async def test_create_users_batch_size(client, users_count, admin_headers):
+    users_data = [
+        {
+            "name": "Floki",
+            "surname": "Builder",
+            "email": f"floki_{number}@clan.com",
+            "password": "Test2373",
+        }
+        for number in range(users_count)
+    ]
+    resp = client.post(
+        "/user/batch", data=json.dumps(users_data), headers=admin_headers
+    )
+    assert resp.status_code == 422
+
+
+async def test_create_users_batch_not_admin(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Ubbe",
+        "surname": "Ragnarsson",
+        "email": "ubbe_ragnarsson@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    users_data = [
+        {
+            "name": "Floki",
+            "surname": "Builder",
+            "email": "floki_builder@clan.com",
+            "password": "Test2373",
+        }
+    ]
+    resp = client.post("/user/batch", data=json.dumps(users_data))
+    assert resp.status_code == 401
+    resp = client.post(
+        "/user/batch",
+        data=json.dumps(users_data),
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 403
@@ -0,0 +1,58 @@
+from uuid import uuid4
+
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_get_user_deadline_exceeded(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Ubba",
+        "surname": "Ragnarsson",
+        "email": "ubba_ragnarsson@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    headers["X-Request-Timeout"] = "0.000001"
+    resp = client.get(f'/user/?user_id={user_data["user_id"]}', headers=headers)
+    assert resp.status_code == 504
+    assert resp.json() == {"detail": "Request deadline exceeded"}
+
+
+async def test_get_user_invalid_request_timeout(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Halfdan",
+        "surname": "Ragnarsson",
+        "email": "halfdan_ragnarsson@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    headers["X-Request-Timeout"] = "soon"
+    resp = client.get(f'/user/?user_id={user_data["user_id"]}', headers=headers)
+    assert resp.status_code == 400
+    assert resp.json() == {"detail": "Invalid X-Request-Timeout header"}
+
+
+async def test_get_user_non_finite_request_timeout(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Sigurd",
+        "surname": "Ragnarsson",
+        "email": "sigurd_snake@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    for timeout in ("nan", "inf"):
+        headers["X-Request-Timeout"] = timeout
+        resp = client.get(f'/user/?user_id={user_data["user_id"]}', headers=headers)
+        assert resp.status_code == 400
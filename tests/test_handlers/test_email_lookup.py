@@ -0,0 +1,74 @@
+import json
+from uuid import uuid4
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from db.crud import email_matches
+from db.crud import GET_USER_BY_EMAIL_SQL
+from db.models import User
+from db.models import UserRole
+
+
+def _plan_indexes(plan: dict) -> set[str]:
+    indexes = {plan["Index Name"]} if "Index Name" in plan else set()
+    for subplan in plan.get("Plans", []):
+        indexes |= _plan_indexes(subplan)
+    return indexes
+
+
+async def _explain(asyncpg_pool, sql: str, *args) -> set[str]:
+    async with asyncpg_pool.acquire() as connection:
+        async with connection.transaction():
+            # the test tables are tiny, make the planner show what it would
+            # do on a big one
+            await connection.execute("SET LOCAL enable_seqscan = off")
+            plan = await connection.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+    return _plan_indexes(json.loads(plan)[0]["Plan"])
+
+
+async def test_create_user_duplicate_mail_other_case(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Soma",
+        "surname": "Jarlscona",
+        "email": "jarlscona_grantsh@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/user/",
+        json={
+            "name": "Soma",
+            "surname": "Jarlscona",
+            "email": "Jarlscona_Grantsh@clan.com",
+            "password": "Raven123",
+        },
+    )
+    assert resp.status_code == 503
+    assert "uq_users_email_lower" in resp.json()["detail"]
+
+
+async def test_email_lookup_uses_lower_email_index(asyncpg_pool):
+    indexes = await _explain(asyncpg_pool, GET_USER_BY_EMAIL_SQL, "soma@clan.com")
+    assert "uq_users_email_lower" in indexes
+    orm_query = select(User).where(email_matches("Soma@Clan.com"))
+    indexes = await _explain(
+        asyncpg_pool,
+        str(
+            orm_query.compile(
+                dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+            )
+        ),
+    )
+    assert "uq_users_email_lower" in indexes
+
+
+async def test_active_users_listing_uses_partial_index(asyncpg_pool):
+    indexes = await _explain(
+        asyncpg_pool,
+        "SELECT user_id FROM users WHERE is_active = true ORDER BY email LIMIT 50",
+    )
+    assert "ix_users_active_email" in indexes
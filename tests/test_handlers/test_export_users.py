@@ -0,0 +1,70 @@
+import csv
+import json
+from uuid import uuid4
+
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+ADMIN_DATA = {
+    "user_id": uuid4(),
+    "name": "Ragnar",
+    "surname": "Lothbrok",
+    "email": "ragnar_admin@clan.com",
+    "is_active": True,
+    "hashed_password": "Raven123",
+    "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+}
+USER_DATA = {
+    "user_id": uuid4(),
+    "name": "Bjorn",
+    "surname": "Ironside",
+    "email": "bjorn_ironside@clan.com",
+    "is_active": False,
+    "hashed_password": "Raven123",
+    "roles": [UserRole.ROLE_USER_SIMPLE],
+}
+
+
+async def test_export_users_ndjson(client, create_user_in_database):
+    for user_data in [ADMIN_DATA, USER_DATA]:
+        await create_user_in_database(**user_data)
+    resp = client.get(
+        "/user/export", headers=create_test_auth_headers_for_user(ADMIN_DATA["email"])
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    exported = {
+        user["user_id"]: user for user in map(json.loads, resp.text.splitlines())
+    }
+    assert exported[str(USER_DATA["user_id"])] == {
+        "user_id": str(USER_DATA["user_id"]),
+        "name": USER_DATA["name"],
+        "surname": USER_DATA["surname"],
+        "email": USER_DATA["email"],
+        "is_active": False,
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    assert len(exported) == 2
+
+
+async def test_export_users_csv(client, create_user_in_database):
+    for user_data in [ADMIN_DATA, USER_DATA]:
+        await create_user_in_database(**user_data)
+    resp = client.get(
+        "/user/export?format=csv",
+        headers=create_test_auth_headers_for_user(ADMIN_DATA["email"]),
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(resp.text.splitlines()))
+    assert len(rows) == 2
+    admin_row = next(row for row in rows if row["email"] == ADMIN_DATA["email"])
+    assert admin_row["roles"] == "ROLE_USER_SIMPLE|ROLE_USER_ADMIN"
+
+
+async def test_export_users_not_admin(client, create_user_in_database):
+    await create_user_in_database(**{**USER_DATA, "is_active": True})
+    resp = client.get(
+        "/user/export", headers=create_test_auth_headers_for_user(USER_DATA["email"])
+    )
+    assert resp.status_code == 403
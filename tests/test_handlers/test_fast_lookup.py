@@ -0,0 +1,67 @@
+from uuid import uuid4
+
+import pytest
+
+import settings
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+@pytest.fixture
+def fast_lookup(monkeypatch):
+    monkeypatch.setattr(settings, "USER_LOOKUP_FAST_PATH", True)
+
+
+async def test_get_user_fast_path(client, create_user_in_database, fast_lookup):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Soma",
+        "surname": "Jarlscona",
+        "email": "jarlscona_grantsh@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.get(
+        f'/user/?user_id={user_data["user_id"]}',
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "user_id": str(user_data["user_id"]),
+        "name": user_data["name"],
+        "surname": user_data["surname"],
+        "email": user_data["email"],
+        "is_active": user_data["is_active"],
+    }
+
+
+async def test_delete_user_fast_path_not_allowed(
+    client, create_user_in_database, fast_lookup
+):
+    user_to_delete = {
+        "user_id": uuid4(),
+        "name": "Rollo",
+        "surname": "Warrior",
+        "email": "warrior_noble@fr.com",
+        "is_active": True,
+        "hashed_password": "Loyal1777",
+        "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+    }
+    user_who_delete = {
+        "user_id": uuid4(),
+        "name": "RandviAdmin",
+        "surname": "Jarlscona",
+        "email": "admin_raven@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+    }
+    for user_data in [user_to_delete, user_who_delete]:
+        await create_user_in_database(**user_data)
+    resp = client.delete(
+        f"/user/?user_id={user_to_delete['user_id']}",
+        headers=create_test_auth_headers_for_user(user_who_delete["email"]),
+    )
+    assert resp.status_code == 403
@@ -76,3 +76,48 @@ async def test_get_user_id_not_found(client, create_user_in_database):
     assert data_from_response == {
         "detail": f"User with id {another_user_id} doesn't exist"
     }
+
+
+async def test_get_users_by_ids(client, create_user_in_database):
+    users_data = [
+        {
+            "user_id": uuid4(),
+            "name": "Soma",
+            "surname": "Jarlscona",
+            "email": "jarlscona_grantsh@clan.com",
+            "is_active": True,
+            "hashed_password": "Raven123",
+            "roles": [UserRole.ROLE_USER_SIMPLE],
+        },
+        {
+            "user_id": uuid4(),
+            "name": "Randvi",
+            "surname": "Jarlscona",
+            "email": "jarlscona_raven@clan.com",
+            "is_active": True,
+            "hashed_password": "Raven123",
+            "roles": [UserRole.ROLE_USER_SIMPLE],
+        },
+    ]
+    for user_data in users_data:
+        await create_user_in_database(**user_data)
+    missing_id = uuid4()
+    user_ids = [
+        str(users_data[1]["user_id"]),
+        str(missing_id),
+        str(users_data[0]["user_id"]),
+        str(users_data[1]["user_id"]),
+    ]
+    resp = client.post(
+        "/user/lookup",
+        json={"user_ids": user_ids},
+        headers=create_test_auth_headers_for_user(users_data[0]["email"]),
+    )
+    assert resp.status_code == 200
+    data_from_resp = resp.json()
+    assert [user["user_id"] for user in data_from_resp["users"]] == [
+        str(users_data[1]["user_id"]),
+        str(users_data[0]["user_id"]),
+    ]
+    assert data_from_resp["users"][0]["name"] == users_data[1]["name"]
+    assert data_from_resp["missing_ids"] == [str(missing_id)]
@@ -0,0 +1,39 @@
+from uuid import uuid4
+
+from db.models import UserRole
+from hashing import async_hasher
+from hashing import Hasher
+
+
+async def test_login_hashing_queue_full(client, create_user_in_database, monkeypatch):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Eivor",
+        "surname": "Varinsdottir",
+        "email": "wolf_kissed@raven.com",
+        "is_active": True,
+        "hashed_password": Hasher.set_password_hashed("Fenrir123"),
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    # every slot of the queue is taken
+    monkeypatch.setattr(async_hasher, "max_queue_depth", 0)
+    rejected_before = async_hasher.stats()["rejected"]
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "Fenrir123"},
+    )
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    assert async_hasher.stats()["rejected"] == rejected_before + 1
+
+
+async def test_hash_many_keeps_input_order(monkeypatch):
+    # five passwords over two workers are hashed as chunks of three and two
+    monkeypatch.setattr(async_hasher, "max_workers", 2)
+    passwords = [f"Fenrir{number}" for number in range(5)]
+    hashed_passwords = await async_hasher.hash_many(passwords)
+    assert len(hashed_passwords) == len(passwords)
+    for password, hashed_password in zip(passwords, hashed_passwords):
+        assert await async_hasher.verify(password, hashed_password)
+    assert not await async_hasher.verify(passwords[0], hashed_passwords[-1])
@@ -0,0 +1,88 @@
+import json
+from uuid import uuid4
+
+from db.models import UserRole
+from hashing import build_pwd_context
+from tests.conftest import create_test_auth_headers_for_user
+
+ADMIN_DATA = {
+    "user_id": uuid4(),
+    "name": "Ragnar",
+    "surname": "Lothbrok",
+    "email": "ragnar_admin@clan.com",
+    "is_active": True,
+    "hashed_password": "Raven123",
+    "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+}
+
+
+async def test_import_users_ndjson(client, create_user_in_database):
+    await create_user_in_database(**ADMIN_DATA)
+    rows = [
+        {
+            "name": "Bjorn",
+            "surname": "Ironside",
+            "email": "bjorn@clan.com",
+            "password": "Test2373",
+        },
+        {
+            "name": "Ivar",
+            "surname": "Boneless",
+            "email": "ivar@clan.com",
+            "hashed_password": build_pwd_context(4).hash("Test2374"),
+        },
+        {"name": "Ubba1", "surname": "Ragnarsson", "email": "ubba@clan.com"},
+        {
+            "name": "Ragnar",
+            "surname": "Lothbrok",
+            "email": ADMIN_DATA["email"],
+            "password": "Test2375",
+        },
+    ]
+    resp = client.post(
+        "/user/import",
+        content="\n".join(map(json.dumps, rows)),
+        headers=create_test_auth_headers_for_user(ADMIN_DATA["email"]),
+    )
+    assert resp.status_code == 200
+    data_from_resp = resp.json()
+    assert data_from_resp["rows"] == 4
+    assert data_from_resp["imported"] == 2
+    assert data_from_resp["rejected"] == 2
+    assert [reject["line"] for reject in data_from_resp["rejects"]] == [3, 4]
+    assert data_from_resp["rejects"][1]["email"] == ADMIN_DATA["email"]
+    resp = client.post(
+        "/login/token", data={"username": "ivar@clan.com", "password": "Test2374"}
+    )
+    assert resp.status_code == 200
+
+
+async def test_import_users_csv(client, create_user_in_database):
+    await create_user_in_database(**ADMIN_DATA)
+    content = (
+        "name,surname,email,password\n"
+        "Bjorn,Ironside,bjorn@clan.com,Test2373\n"
+        "Ivar,Boneless,not-an-email,Test2374\n"
+    )
+    resp = client.post(
+        "/user/import?format=csv",
+        content=content,
+        headers=create_test_auth_headers_for_user(ADMIN_DATA["email"]),
+    )
+    assert resp.status_code == 200
+    data_from_resp = resp.json()
+    assert data_from_resp["imported"] == 1
+    assert data_from_resp["rejects"][0]["line"] == 3
+    assert data_from_resp["rejects"][0]["reason"].startswith("email")
+
+
+async def test_import_users_not_admin(client, create_user_in_database):
+    await create_user_in_database(
+        **{**ADMIN_DATA, "roles": [UserRole.ROLE_USER_SIMPLE]}
+    )
+    resp = client.post(
+        "/user/import",
+        content="",
+        headers=create_test_auth_headers_for_user(ADMIN_DATA["email"]),
+    )
+    assert resp.status_code == 403
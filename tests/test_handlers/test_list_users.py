@@ -0,0 +1,86 @@
+from uuid import uuid4
+
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_list_users_pagination(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Ragnar",
+        "surname": "Lothbrok",
+        "email": "ragnar_admin@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+    }
+    users_data = [
+        {
+            "user_id": uuid4(),
+            "name": name,
+            "surname": "Ragnarsson",
+            "email": f"{name.lower()}@clan.com",
+            "is_active": is_active,
+            "hashed_password": "Raven123",
+            "roles": [UserRole.ROLE_USER_SIMPLE],
+        }
+        for name, is_active in [("Bjorn", True), ("Ivar", False), ("Ubba", True)]
+    ]
+    for user_data in [admin_data, *users_data]:
+        await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(admin_data["email"])
+    emails, cursor = [], None
+    while True:
+        params = {"order_by": "email", "limit": 1, "is_active": True}
+        if cursor is not None:
+            params["cursor"] = cursor
+        resp = client.get("/user/list", params=params, headers=headers)
+        assert resp.status_code == 200
+        data_from_resp = resp.json()
+        assert len(data_from_resp["users"]) == 1
+        emails.append(data_from_resp["users"][0]["email"])
+        cursor = data_from_resp["next_cursor"]
+        if cursor is None:
+            break
+    assert emails == ["bjorn@clan.com", "ragnar_admin@clan.com", "ubba@clan.com"]
+    resp = client.get(
+        "/user/list", params={"role": UserRole.ROLE_USER_ADMIN}, headers=headers
+    )
+    assert resp.status_code == 200
+    assert [user["email"] for user in resp.json()["users"]] == [admin_data["email"]]
+
+
+async def test_list_users_not_admin(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Soma",
+        "surname": "Jarlscona",
+        "email": "jarlscona_grantsh@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.get(
+        "/user/list", headers=create_test_auth_headers_for_user(user_data["email"])
+    )
+    assert resp.status_code == 403
+
+
+async def test_list_users_invalid_cursor(client, create_user_in_database):
+    admin_data = {
+        "user_id": uuid4(),
+        "name": "Ragnar",
+        "surname": "Lothbrok",
+        "email": "ragnar_admin@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+    }
+    await create_user_in_database(**admin_data)
+    resp = client.get(
+        "/user/list",
+        params={"cursor": "not-a-cursor"},
+        headers=create_test_auth_headers_for_user(admin_data["email"]),
+    )
+    assert resp.status_code == 422
@@ -0,0 +1,80 @@
+from uuid import uuid4
+
+from db.models import UserRole
+from hashing import build_pwd_context
+from hashing import Hasher
+
+
+async def test_login(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Eivor",
+        "surname": "Varinsdottir",
+        "email": "wolf_kissed@raven.com",
+        "is_active": True,
+        "hashed_password": Hasher.set_password_hashed("Fenrir123"),
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "Fenrir123"},
+    )
+    assert resp.status_code == 200
+    data_from_resp = resp.json()
+    assert data_from_resp["token_type"] == "bearer"
+    assert data_from_resp["access_token"]
+
+
+async def test_login_wrong_password(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Eivor",
+        "surname": "Varinsdottir",
+        "email": "wolf_kissed@raven.com",
+        "is_active": True,
+        "hashed_password": Hasher.set_password_hashed("Fenrir123"),
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "Odin123"},
+    )
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "The username or password is incorrect."}
+
+
+async def test_login_rehashes_outdated_hash(
+    client, create_user_in_database, get_user_from_database
+):
+    outdated_hash = build_pwd_context(4).hash("Fenrir123")
+    assert Hasher.needs_update(outdated_hash)
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Eivor",
+        "surname": "Varinsdottir",
+        "email": "wolf_kissed@raven.com",
+        "is_active": True,
+        "hashed_password": outdated_hash,
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token",
+        data={"username": user_data["email"], "password": "Fenrir123"},
+    )
+    assert resp.status_code == 200
+    users_from_db = await get_user_from_database(user_data["user_id"])
+    new_hash = dict(users_from_db[0])["hashed_password"]
+    assert new_hash != outdated_hash
+    assert not Hasher.needs_update(new_hash)
+    assert Hasher.verify_password("Fenrir123", new_hash)
+    # the rehash is invisible to ETags and to issued tokens
+    assert dict(users_from_db[0])["version"] == 1
+    assert dict(users_from_db[0])["security_version"] == 0
+
+
+async def test_stronger_hash_is_not_outdated():
+    # workers with a lower BCRYPT_ROUNDS must not rehash stronger hashes
+    assert not Hasher.needs_update(build_pwd_context(13).hash("Fenrir123"))
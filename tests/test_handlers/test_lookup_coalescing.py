@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+import settings
+from db.crud import user_loader
+from db.crud import UserCRUD
+from db.crud import UserLoader
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+@pytest.fixture
+def coalescing(monkeypatch):
+    monkeypatch.setattr(settings, "USER_LOOKUP_COALESCING", True)
+
+
+async def test_concurrent_lookups_share_one_query(
+    async_session_test, create_user_in_database, coalescing
+):
+    users = [
+        {
+            "user_id": uuid4(),
+            "name": "Bjorn",
+            "surname": "Ironside",
+            "email": f"Bjorn_{number}@clan.com",
+            "is_active": True,
+            "hashed_password": "Raven123",
+            "roles": [UserRole.ROLE_USER_SIMPLE],
+        }
+        for number in range(3)
+    ]
+    for user_data in users:
+        await create_user_in_database(**user_data)
+    keys = [users[0]["user_id"], users[0]["user_id"], users[1]["user_id"]]
+    queries_before = user_loader.queries
+    coalesced_before = user_loader.coalesced
+
+    async def get_user(user_id):
+        async with async_session_test() as db_session:
+            return await UserCRUD(db_session).get_user_by_id(user_id)
+
+    found = await asyncio.gather(*(get_user(user_id) for user_id in keys))
+    assert [user.user_id for user in found] == keys
+    assert user_loader.queries == queries_before + 1
+    assert user_loader.coalesced == coalesced_before + 1
+
+    async def get_user_by_email(email):
+        async with async_session_test() as db_session:
+            return await UserCRUD(db_session).get_user_by_email(email)
+
+    missing, by_email = await asyncio.gather(
+        get_user(uuid4()), get_user_by_email(users[2]["email"].upper())
+    )
+    assert missing is None
+    assert by_email.user_id == users[2]["user_id"]
+
+
+async def test_get_user_with_coalescing(client, create_user_in_database, coalescing):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Ubbe",
+        "surname": "Ragnarsson",
+        "email": "ubbe_ragnarsson@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.get(
+        f'/user/?user_id={user_data["user_id"]}',
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 200
+    assert resp.json()["user_id"] == str(user_data["user_id"])
+    assert client.get("/service/metrics").json()["user_loader"]["loads"] > 0
+
+
+@pytest.fixture
+def slow_loader():
+    """UserLoader whose query runs until `release` is set."""
+    loader = UserLoader(window=0)
+    loader.fetched = []
+    loader.query_started = asyncio.Event()
+    loader.release = asyncio.Event()
+
+    async def fetch(key_name, keys, db_session):
+        loader.fetched.append(keys)
+        loader.query_started.set()
+        await loader.release.wait()
+        if keys == ["broken"]:
+            raise ConnectionError("connection lost")
+        return {key: f"user {key}" for key in keys}
+
+    loader._fetch = fetch
+    return loader
+
+
+async def test_lookups_during_query_share_it(slow_loader):
+    db_session = SimpleNamespace(bind="primary")
+    leader = asyncio.create_task(slow_loader.load("user_id", 1, db_session))
+    await slow_loader.query_started.wait()
+    # the window is closed but the query hasn't returned yet
+    followers = [
+        asyncio.create_task(slow_loader.load("user_id", 1, db_session))
+        for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    slow_loader.release.set()
+    assert await asyncio.gather(leader, *followers) == ["user 1"] * 4
+    assert slow_loader.queries == 1
+    assert slow_loader.coalesced == 3
+    assert slow_loader.fetched == [[1]]
+    # a lookup after the query returned runs a new one
+    assert await slow_loader.load("user_id", 1, db_session) == "user 1"
+    assert slow_loader.queries == 2
+
+
+async def test_failed_query_reaches_waiting_lookups(slow_loader):
+    db_session = SimpleNamespace(bind="primary")
+    leader = asyncio.create_task(slow_loader.load("user_id", "broken", db_session))
+    await slow_loader.query_started.wait()
+    follower = asyncio.create_task(slow_loader.load("user_id", "broken", db_session))
+    await asyncio.sleep(0)
+    slow_loader.release.set()
+    for lookup in (leader, follower):
+        with pytest.raises(ConnectionError):
+            await lookup
+    assert slow_loader.queries == 1
+    assert slow_loader._pending == {}
@@ -0,0 +1,43 @@
+from time import monotonic
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import settings
+from db.session import checkout_stats
+from db.session import InstrumentedQueuePool
+from db.session import PoolTimeoutError
+from deadline import request_deadline
+
+
+def test_recreated_pool_keeps_configured_timeout():
+    pool = InstrumentedQueuePool(lambda: None, pool_size=1, timeout=5)
+    token = request_deadline.set(monotonic() + 0.5)
+    try:
+        assert pool._timeout <= 0.5
+        recreated_pool = pool.recreate()
+    finally:
+        request_deadline.reset(token)
+    assert recreated_pool.timeout() == 5
+    assert recreated_pool._timeout == 5
+
+
+async def test_checkout_past_pool_size_is_counted():
+    engine = create_async_engine(
+        settings.TEST_DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    try:
+        checkouts_before = checkout_stats.stats()["checkouts"]
+        timeouts_before = checkout_stats.timeouts
+        async with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                async with engine.connect():
+                    pass
+        assert checkout_stats.stats()["checkouts"] == checkouts_before + 1
+        assert checkout_stats.timeouts == timeouts_before + 1
+    finally:
+        await engine.dispose()
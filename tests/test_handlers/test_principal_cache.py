@@ -0,0 +1,68 @@
+from uuid import uuid4
+
+import pytest
+
+from db.crud import principal_cache
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+@pytest.fixture
+def enabled_principal_cache(monkeypatch):
+    monkeypatch.setattr(principal_cache.by_id, "max_size", 100)
+    monkeypatch.setattr(principal_cache.email_index, "max_size", 100)
+    yield principal_cache
+    principal_cache.clear()
+
+
+async def test_demoted_admin_not_served_from_cache(
+    client, create_user_in_database, get_user_from_database, enabled_principal_cache
+):
+    superadmin = {
+        "user_id": uuid4(),
+        "name": "Odin",
+        "surname": "Harvy",
+        "email": "the_one@god.com",
+        "is_active": True,
+        "hashed_password": "GOD1",
+        "roles": [UserRole.ROLE_USER_SUPERADMIN],
+    }
+    admin = {
+        "user_id": uuid4(),
+        "name": "Valka",
+        "surname": "Witch",
+        "email": "witch_raven@clan.com",
+        "is_active": True,
+        "hashed_password": "Witch123",
+        "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+    }
+    user = {
+        "user_id": uuid4(),
+        "name": "Rollo",
+        "surname": "Warrior",
+        "email": "warrior_noble@fr.com",
+        "is_active": True,
+        "hashed_password": "Loyal1777",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    for user_data in [superadmin, admin, user]:
+        await create_user_in_database(**user_data)
+    # put the admin principal into the cache
+    resp = client.get(
+        f"/user/?user_id={admin['user_id']}",
+        headers=create_test_auth_headers_for_user(admin["email"]),
+    )
+    assert resp.status_code == 200
+    assert enabled_principal_cache.get_by_email(admin["email"]) is not None
+    resp = client.delete(
+        f"/user/admin_privilege/?user_id={admin['user_id']}",
+        headers=create_test_auth_headers_for_user(superadmin["email"]),
+    )
+    assert resp.status_code == 200
+    resp = client.delete(
+        f"/user/?user_id={user['user_id']}",
+        headers=create_test_auth_headers_for_user(admin["email"]),
+    )
+    assert resp.status_code == 403
+    users_from_db = await get_user_from_database(user["user_id"])
+    assert dict(users_from_db[0])["is_active"] is True
@@ -0,0 +1,74 @@
+from uuid import uuid4
+
+import pytest
+
+import settings
+from db.crud import security_version_cache
+from db.models import UserRole
+from hashing import Hasher
+
+
+@pytest.fixture
+def embed_principal(monkeypatch):
+    monkeypatch.setattr(settings, "TOKEN_EMBED_PRINCIPAL", True)
+    yield
+    security_version_cache.clear()
+
+
+def login(client, email: str, password: str) -> dict[str, str]:
+    resp = client.post("/login/token", data={"username": email, "password": password})
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+async def test_self_contained_token(client, create_user_in_database, embed_principal):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Soma",
+        "surname": "Jarlscona",
+        "email": "jarlscona_grantsh@clan.com",
+        "is_active": True,
+        "hashed_password": Hasher.set_password_hashed("Raven123"),
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    headers = login(client, user_data["email"], "Raven123")
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["email"] == user_data["email"]
+
+
+async def test_self_contained_token_rejected_after_role_change(
+    client, create_user_in_database, embed_principal
+):
+    superadmin = {
+        "user_id": uuid4(),
+        "name": "Odin",
+        "surname": "Harvy",
+        "email": "the_one@god.com",
+        "is_active": True,
+        "hashed_password": Hasher.set_password_hashed("GOD1"),
+        "roles": [UserRole.ROLE_USER_SUPERADMIN],
+    }
+    admin = {
+        "user_id": uuid4(),
+        "name": "Valka",
+        "surname": "Witch",
+        "email": "witch_raven@clan.com",
+        "is_active": True,
+        "hashed_password": Hasher.set_password_hashed("Witch123"),
+        "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+    }
+    for user_data in [superadmin, admin]:
+        await create_user_in_database(**user_data)
+    admin_headers = login(client, admin["email"], "Witch123")
+    resp = client.get(f"/user/?user_id={admin['user_id']}", headers=admin_headers)
+    assert resp.status_code == 200
+    resp = client.delete(
+        f"/user/admin_privilege/?user_id={admin['user_id']}",
+        headers=login(client, superadmin["email"], "GOD1"),
+    )
+    assert resp.status_code == 200
+    resp = client.get(f"/user/?user_id={admin['user_id']}", headers=admin_headers)
+    assert resp.status_code == 401
+    assert resp.json() == {"detail": "Couldn't validate credentials"}
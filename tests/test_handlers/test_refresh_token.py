@@ -0,0 +1,116 @@
+import json
+from datetime import datetime
+from datetime import timedelta
+from uuid import uuid4
+
+from db.models import UserRole
+from hashing import Hasher
+from revocation import revocation_list
+
+
+async def test_refresh_access_token(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Soma",
+        "surname": "Jarlscona",
+        "email": "jarlscona_grantsh@clan.com",
+        "is_active": True,
+        "hashed_password": Hasher.set_password_hashed("Raven123"),
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token", data={"username": user_data["email"], "password": "Raven123"}
+    )
+    assert resp.status_code == 200
+    refresh_token = resp.json()["refresh_token"]
+    resp = client.post(
+        "/login/refresh", data=json.dumps({"refresh_token": refresh_token})
+    )
+    assert resp.status_code == 200
+    access_token = resp.json()["access_token"]
+    resp = client.get(
+        f"/user/?user_id={user_data['user_id']}",
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert resp.status_code == 200
+
+
+async def test_refresh_token_not_accepted_as_access_token(
+    client, create_user_in_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Soma",
+        "surname": "Jarlscona",
+        "email": "jarlscona_grantsh@clan.com",
+        "is_active": True,
+        "hashed_password": Hasher.set_password_hashed("Raven123"),
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token", data={"username": user_data["email"], "password": "Raven123"}
+    )
+    refresh_token = resp.json()["refresh_token"]
+    resp = client.get(
+        f"/user/?user_id={user_data['user_id']}",
+        headers={"Authorization": f"Bearer {refresh_token}"},
+    )
+    assert resp.status_code == 401
+
+
+async def test_revoke_tokens(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Soma",
+        "surname": "Jarlscona",
+        "email": "jarlscona_grantsh@clan.com",
+        "is_active": True,
+        "hashed_password": Hasher.set_password_hashed("Raven123"),
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    resp = client.post(
+        "/login/token", data={"username": user_data["email"], "password": "Raven123"}
+    )
+    tokens = resp.json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    resp = client.post(
+        "/login/revoke",
+        data=json.dumps({"refresh_token": tokens["refresh_token"]}),
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    assert len(resp.json()["revoked_jtis"]) == 2
+    resp = client.get(f"/user/?user_id={user_data['user_id']}", headers=headers)
+    assert resp.status_code == 401
+    resp = client.post(
+        "/login/refresh", data=json.dumps({"refresh_token": tokens["refresh_token"]})
+    )
+    assert resp.status_code == 401
+
+
+async def test_sync_loads_other_workers_revocations(async_session_test, asyncpg_pool):
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    loaded_jti, other_worker_jti, own_jti = str(uuid4()), str(uuid4()), str(uuid4())
+    async with asyncpg_pool.acquire() as connection:
+        await connection.execute(
+            "INSERT INTO revoked_tokens (jti, expires_at) VALUES ($1, $2)",
+            loaded_jti,
+            expires_at,
+        )
+    async with async_session_test() as db_session:
+        await revocation_list.rebuild(db_session)
+    async with asyncpg_pool.acquire() as connection:
+        for jti in (other_worker_jti, own_jti):
+            await connection.execute(
+                "INSERT INTO revoked_tokens (jti, expires_at) VALUES ($1, $2)",
+                jti,
+                expires_at,
+            )
+    # revoking locally must not skip what other workers revoked before
+    revocation_list.add(own_jti)
+    async with async_session_test() as db_session:
+        await revocation_list.sync(db_session)
+    assert revocation_list.might_be_revoked(other_worker_jti)
@@ -0,0 +1,125 @@
+from typing import Optional
+
+import pytest
+from fastapi import Request
+
+import db.session
+from db.session import CONSISTENCY_TOKEN_HEADER
+from db.session import get_consistency_token
+from db.session import get_db_read
+from db.session import parse_lsn
+from db.session import ReplicaRouter
+
+
+class StubReplica:
+    """Stands in for read_engine, answers the replay LSN and lag probe."""
+
+    def __init__(self, replay_lsn: Optional[str], lag: Optional[float]):
+        self.replay_lsn = replay_lsn
+        self.lag = lag
+        self.probes = 0
+
+    def connect(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, query):
+        self.probes += 1
+        return self
+
+    def one(self):
+        return self.replay_lsn, self.lag
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    def stub(replay_lsn: Optional[str] = "0/3000000", lag: Optional[float] = 0.0):
+        stub_replica = StubReplica(replay_lsn, lag)
+        monkeypatch.setattr(db.session, "read_engine", stub_replica)
+        return stub_replica
+
+    return stub
+
+
+@pytest.fixture
+def router():
+    return ReplicaRouter(status_ttl=60, max_lag=1.0)
+
+
+def test_parse_lsn():
+    assert parse_lsn("0/3000000") == 0x3000000
+    assert parse_lsn("16/B374D848") == (0x16 << 32) + 0xB374D848
+    assert parse_lsn("1/0") > parse_lsn("0/FFFFFFFF")
+    for malformed_lsn in ("", "garbage", "1/2/3", "zz/1"):
+        with pytest.raises(ValueError):
+            parse_lsn(malformed_lsn)
+
+
+async def test_no_replica_configured(router, monkeypatch):
+    monkeypatch.setattr(db.session, "read_engine", None)
+    assert not await router.use_replica(None)
+    assert not await router.use_replica("0/1")
+
+
+async def test_replica_serves_reads_without_token(replica, router):
+    stub_replica = replica()
+    assert await router.use_replica(None)
+    assert await router.use_replica(None)
+    # the probe result is shared until status_ttl runs out
+    assert stub_replica.probes == 1
+
+
+async def test_token_not_replayed_yet(replica, router):
+    replica(replay_lsn="0/3000000")
+    assert await router.use_replica("0/3000000")
+    assert await router.use_replica("0/2FFFFFF")
+    assert not await router.use_replica("0/3000001")
+    assert not await router.use_replica("1/0")
+
+
+async def test_replica_lag_over_limit(replica, router):
+    replica(lag=1.5)
+    assert not await router.use_replica(None)
+    assert not await router.use_replica("0/1")
+
+
+async def test_replica_status_unknown(replica, router):
+    replica(replay_lsn=None, lag=None)
+    assert not await router.use_replica(None)
+
+
+async def test_garbage_token_goes_to_primary(replica, router):
+    replica()
+    assert await router.use_replica(None)
+    assert not await router.use_replica("")
+    assert not await router.use_replica("garbage")
+    assert not await router.use_replica("zz/1")
+
+
+async def test_malformed_consistency_token_header(replica, router, monkeypatch):
+    replica()
+    # engines count as initialized, sessions are never used for a query
+    monkeypatch.setattr(db.session, "engine", object())
+    monkeypatch.setattr(db.session, "replica_router", router)
+    request = Request(
+        {
+            "type": "http",
+            "headers": [(CONSISTENCY_TOKEN_HEADER.lower().encode(), b"not-an-lsn")],
+        }
+    )
+    sessions = get_db_read(request)
+    db_session = await sessions.__anext__()
+    assert not db_session.info.get("replica")
+    await sessions.aclose()
+    assert router.primary_reads == 1
+    assert router.replica_reads == 0
+
+
+async def test_no_consistency_token_without_replica(monkeypatch):
+    monkeypatch.setattr(db.session, "read_engine", None)
+    assert await get_consistency_token(db_session=None) is None
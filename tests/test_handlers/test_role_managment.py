@@ -2,6 +2,7 @@ from uuid import uuid4
 
 import pytest
 
+from db.models import ROLE_BITS
 from db.models import UserRole
 from tests.conftest import create_test_auth_headers_for_user
 
@@ -136,3 +137,93 @@ async def test_revoke_admin_role_from_not_superadmin(
         failed_to_revoke_admin_role["user_id"] == user_to_revoke_admin_role["user_id"]
     )
     assert UserRole.ROLE_USER_ADMIN in failed_to_revoke_admin_role["roles"]
+
+
+async def test_grant_admin_role_to_admin(
+    client, create_user_in_database, get_user_from_database
+):
+    superadmin = {
+        "user_id": uuid4(),
+        "name": "Odin",
+        "surname": "Harvy",
+        "email": "the_one@god.com",
+        "is_active": True,
+        "hashed_password": "GOD1",
+        "roles": [UserRole.ROLE_USER_SUPERADMIN],
+    }
+    admin = {
+        "user_id": uuid4(),
+        "name": "Valka",
+        "surname": "Witch",
+        "email": "witch_raven@clan.com",
+        "is_active": True,
+        "hashed_password": "Witch123",
+        "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+    }
+    await create_user_in_database(**superadmin)
+    await create_user_in_database(**admin)
+    resp = client.patch(
+        f"/user/admin_privilege/?user_id={admin['user_id']}",
+        headers=create_test_auth_headers_for_user(superadmin["email"]),
+    )
+    assert resp.status_code == 409
+    assert resp.json() == {
+        "detail": f"User with id {admin['user_id']} is already an admin"
+    }
+    users_from_db = await get_user_from_database(admin["user_id"])
+    assert dict(users_from_db[0])["roles"].count(UserRole.ROLE_USER_ADMIN) == 1
+
+
+async def test_grant_admin_role_user_not_found(client, create_user_in_database):
+    superadmin = {
+        "user_id": uuid4(),
+        "name": "Odin",
+        "surname": "Harvy",
+        "email": "the_one@god.com",
+        "is_active": True,
+        "hashed_password": "GOD1",
+        "roles": [UserRole.ROLE_USER_SUPERADMIN],
+    }
+    await create_user_in_database(**superadmin)
+    another_user_id = uuid4()
+    resp = client.patch(
+        f"/user/admin_privilege/?user_id={another_user_id}",
+        headers=create_test_auth_headers_for_user(superadmin["email"]),
+    )
+    assert resp.status_code == 404
+
+
+async def test_role_mask_follows_roles(
+    client, create_user_in_database, get_user_from_database
+):
+    superadmin = {
+        "user_id": uuid4(),
+        "name": "Odin",
+        "surname": "Harvy",
+        "email": "the_one@god.com",
+        "is_active": True,
+        "hashed_password": "GOD1",
+        "roles": [UserRole.ROLE_USER_SUPERADMIN],
+    }
+    user_to_grant_admin = {
+        "user_id": uuid4(),
+        "name": "Valka",
+        "surname": "Witch",
+        "email": "witch_raven@clan.com",
+        "is_active": True,
+        "hashed_password": "Witch123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**superadmin)
+    await create_user_in_database(**user_to_grant_admin)
+    users_from_db = await get_user_from_database(user_to_grant_admin["user_id"])
+    assert dict(users_from_db[0])["role_mask"] == ROLE_BITS[UserRole.ROLE_USER_SIMPLE]
+    resp = client.patch(
+        f"/user/admin_privilege/?user_id={user_to_grant_admin['user_id']}",
+        headers=create_test_auth_headers_for_user(superadmin["email"]),
+    )
+    assert resp.status_code == 200
+    users_from_db = await get_user_from_database(user_to_grant_admin["user_id"])
+    assert dict(users_from_db[0])["role_mask"] == (
+        ROLE_BITS[UserRole.ROLE_USER_SIMPLE] | ROLE_BITS[UserRole.ROLE_USER_ADMIN]
+    )
@@ -0,0 +1,65 @@
+from uuid import uuid4
+
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+ADMIN_DATA = {
+    "user_id": uuid4(),
+    "name": "Ragnar",
+    "surname": "Lothbrok",
+    "email": "ragnar_admin@clan.com",
+    "is_active": True,
+    "hashed_password": "Raven123",
+    "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+}
+
+
+async def test_search_users(client, create_user_in_database):
+    users_data = [
+        {
+            "user_id": uuid4(),
+            "name": name,
+            "surname": surname,
+            "email": f"{name.lower()}@clan.com",
+            "is_active": True,
+            "hashed_password": "Raven123",
+            "roles": [UserRole.ROLE_USER_SIMPLE],
+        }
+        for name, surname in [
+            ("Sigurd", "Ragnarsson"),
+            ("Sigrid", "Thorsdottir"),
+            ("Ubba", "Halfdansson"),
+        ]
+    ]
+    for user_data in [ADMIN_DATA, *users_data]:
+        await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(ADMIN_DATA["email"])
+    resp = client.get("/user/search", params={"q": "Sigur"}, headers=headers)
+    assert resp.status_code == 200
+    names = [user["name"] for user in resp.json()["users"]]
+    # the prefix match ranks first, the similar name follows
+    assert names[0] == "Sigurd"
+    assert "Ubba" not in names
+    # one row per page, keyset cursor walks the same ranking
+    paged_names, cursor = [], None
+    while True:
+        params = {"q": "Sigur", "limit": 1}
+        if cursor is not None:
+            params["cursor"] = cursor
+        resp = client.get("/user/search", params=params, headers=headers)
+        assert resp.status_code == 200
+        paged_names.extend(user["name"] for user in resp.json()["users"])
+        cursor = resp.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert paged_names == names
+
+
+async def test_search_users_query_too_short(client, create_user_in_database):
+    await create_user_in_database(**ADMIN_DATA)
+    resp = client.get(
+        "/user/search",
+        params={"q": "Si"},
+        headers=create_test_auth_headers_for_user(ADMIN_DATA["email"]),
+    )
+    assert resp.status_code == 422
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+from datetime import datetime
+from datetime import timedelta
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.testclient import TestClient
+
+import settings
+from main import app
+from revocation import revocation_list
+
+REQUIRED_SETTINGS = [
+    "HOME_DIRECTORY",
+    "DB_HOST",
+    "DB_PORT_PROD",
+    "DB_NAME_PROD",
+    "DB_USER_PROD",
+    "DB_PASS_PROD",
+    "DB_PORT_TEST",
+    "DB_NAME_TEST",
+    "DB_USER_TEST",
+    "DB_PASS_TEST",
+    "SECRET_KEY",
+]
+
+
+def test_import_main_without_settings():
+    env = {
+        name: value
+        for name, value in os.environ.items()
+        if name not in REQUIRED_SETTINGS and not name.endswith("_DATABASE_URL")
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", "import main"],
+        cwd=Path(__file__).parents[2],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+async def test_startup_uses_app_session_factory(asyncpg_pool, monkeypatch):
+    async with asyncpg_pool.acquire() as connection:
+        await connection.execute(
+            """INSERT INTO revoked_tokens (jti, expires_at) VALUES ($1, $2);""",
+            "revoked_before_startup",
+            datetime.utcnow() + timedelta(hours=1),
+        )
+    monkeypatch.setattr(
+        app.state,
+        "session_factory",
+        sessionmaker(
+            create_async_engine(settings.TEST_DATABASE_URL, future=True),
+            expire_on_commit=False,
+            class_=AsyncSession,
+        ),
+        raising=False,
+    )
+    with TestClient(app):
+        assert revocation_list.might_be_revoked("revoked_before_startup")
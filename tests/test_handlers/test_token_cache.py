@@ -0,0 +1,73 @@
+import time
+from datetime import timedelta
+
+import pytest
+from jose import jwt
+
+from security import create_access_token
+from security import decode_token
+from security import invalidate_token
+from security import InvalidTokenError
+from security import token_cache
+
+
+@pytest.fixture
+def counted_decode(monkeypatch):
+    calls = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(args[0])
+        return decode(*args, **kwargs)
+
+    token_cache.clear()
+    monkeypatch.setattr(jwt, "decode", counting_decode)
+    yield calls
+    token_cache.clear()
+
+
+def tamper(token: str) -> str:
+    header, payload, signature = token.split(".")
+    flipped = "A" if signature[0] != "A" else "B"
+    return ".".join([header, payload, flipped + signature[1:]])
+
+
+async def test_cache_hit_skips_decode(counted_decode):
+    token = create_access_token(data={"sub": "wolf_kissed@raven.com"})
+    assert decode_token(token)["sub"] == "wolf_kissed@raven.com"
+    assert decode_token(token)["sub"] == "wolf_kissed@raven.com"
+    assert len(counted_decode) == 1
+
+
+async def test_cached_token_is_rejected_after_exp(counted_decode):
+    token = create_access_token(
+        data={"sub": "wolf_kissed@raven.com"}, expires_delta=timedelta(seconds=1)
+    )
+    decode_token(token)
+    time.sleep(2)
+    with pytest.raises(InvalidTokenError):
+        decode_token(token)
+    # the expired entry was dropped and the token verified again
+    assert len(counted_decode) == 2
+    assert len(token_cache) == 0
+
+
+async def test_invalidate_token_evicts_entry(counted_decode):
+    token = create_access_token(data={"sub": "wolf_kissed@raven.com"})
+    decode_token(token)
+    invalidate_token(token)
+    assert len(token_cache) == 0
+    decode_token(token)
+    assert len(counted_decode) == 2
+
+
+async def test_tampered_token_is_not_served_from_cache(counted_decode):
+    token = create_access_token(data={"sub": "wolf_kissed@raven.com"})
+    decode_token(token)
+    tampered_token = tamper(token)
+    with pytest.raises(InvalidTokenError):
+        decode_token(tampered_token)
+    with pytest.raises(InvalidTokenError):
+        decode_token(tampered_token)
+    assert counted_decode == [token, tampered_token, tampered_token]
+    assert len(token_cache) == 1
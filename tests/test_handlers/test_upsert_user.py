@@ -0,0 +1,151 @@
+import json
+from uuid import uuid4
+
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+ADMIN_DATA = {
+    "user_id": uuid4(),
+    "name": "Ragnar",
+    "surname": "Lothbrok",
+    "email": "ragnar_king@clan.com",
+    "is_active": True,
+    "hashed_password": "Raven123",
+    "roles": [UserRole.ROLE_USER_SIMPLE, UserRole.ROLE_USER_ADMIN],
+}
+
+
+async def test_upsert_user(client, create_user_in_database, get_user_from_database):
+    await create_user_in_database(**ADMIN_DATA)
+    headers = create_test_auth_headers_for_user(ADMIN_DATA["email"])
+    user_data = {
+        "name": "Helga",
+        "surname": "Flokisdottir",
+        "email": "helga_flokis@clan.com",
+        "password": "Raven123",
+    }
+    resp = client.put("/user/", data=json.dumps(user_data), headers=headers)
+    assert resp.status_code == 201
+    created = resp.json()
+    assert created["created"] is True
+    assert created["version"] == 1
+
+    user_data.update(surname="Boatbuilder", email="Helga_Flokis@clan.com")
+    resp = client.put("/user/", data=json.dumps(user_data), headers=headers)
+    assert resp.status_code == 200
+    updated = resp.json()
+    assert updated["created"] is False
+    assert updated["user_id"] == created["user_id"]
+    assert resp.headers["ETag"] == '"2"'
+    users_from_db = await get_user_from_database(created["user_id"])
+    assert dict(users_from_db[0])["surname"] == "Boatbuilder"
+    assert dict(users_from_db[0])["email"] == "Helga_Flokis@clan.com"
+    # the password hash was replaced, tokens issued before are stale
+    assert dict(users_from_db[0])["security_version"] == 1
+
+
+async def test_upsert_users_batch(
+    client, create_user_in_database, get_user_from_database
+):
+    await create_user_in_database(**ADMIN_DATA)
+    existing_user = {
+        "user_id": uuid4(),
+        "name": "Torvi",
+        "surname": "Shieldmaiden",
+        "email": "torvi_shield@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**existing_user)
+    bodies = [
+        {
+            "name": "Torvi",
+            "surname": "Lothbrok",
+            "email": existing_user["email"],
+            "password": "Raven123",
+        },
+        {
+            "name": "Hvitserk",
+            "surname": "Ragnarsson",
+            "email": "hvitserk_white@clan.com",
+            "password": "Raven123",
+        },
+        {
+            "name": "Ragnar",
+            "surname": "Farmer",
+            "email": ADMIN_DATA["email"],
+            "password": "Raven123",
+        },
+    ]
+    resp = client.put(
+        "/user/batch",
+        data=json.dumps(bodies),
+        headers=create_test_auth_headers_for_user(ADMIN_DATA["email"]),
+    )
+    assert resp.status_code == 200
+    result = resp.json()
+    assert (result["created"], result["updated"]) == (1, 1)
+    assert result["skipped"] == [ADMIN_DATA["email"]]
+    assert [user["created"] for user in result["users"]] == [False, True]
+    users_from_db = await get_user_from_database(existing_user["user_id"])
+    assert dict(users_from_db[0])["surname"] == "Lothbrok"
+    admins_from_db = await get_user_from_database(ADMIN_DATA["user_id"])
+    assert dict(admins_from_db[0])["surname"] == ADMIN_DATA["surname"]
+
+
+async def test_upsert_skips_deactivated_users(
+    client, create_user_in_database, get_user_from_database
+):
+    await create_user_in_database(**ADMIN_DATA)
+    deactivated_user = {
+        "user_id": uuid4(),
+        "name": "Aslaug",
+        "surname": "Sigurdsdottir",
+        "email": "aslaug_queen@clan.com",
+        "is_active": False,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**deactivated_user)
+    resp = client.put(
+        "/user/batch",
+        data=json.dumps(
+            [
+                {
+                    "name": "Aslaug",
+                    "surname": "Lothbrok",
+                    "email": deactivated_user["email"],
+                    "password": "Serpent123",
+                }
+            ]
+        ),
+        headers=create_test_auth_headers_for_user(ADMIN_DATA["email"]),
+    )
+    assert resp.status_code == 200
+    result = resp.json()
+    assert (result["created"], result["updated"]) == (0, 0)
+    assert result["skipped"] == [deactivated_user["email"]]
+    users_from_db = await get_user_from_database(deactivated_user["user_id"])
+    user_from_db = dict(users_from_db[0])
+    assert user_from_db["is_active"] is False
+    assert user_from_db["surname"] == deactivated_user["surname"]
+    assert user_from_db["hashed_password"] == deactivated_user["hashed_password"]
+
+
+async def test_upsert_user_not_admin(client, create_user_in_database):
+    user_data = {**ADMIN_DATA, "roles": [UserRole.ROLE_USER_SIMPLE]}
+    await create_user_in_database(**user_data)
+    resp = client.put(
+        "/user/",
+        data=json.dumps(
+            {
+                "name": "Ragnar",
+                "surname": "Farmer",
+                "email": user_data["email"],
+                "password": "Raven123",
+            }
+        ),
+        headers=create_test_auth_headers_for_user(user_data["email"]),
+    )
+    assert resp.status_code == 403
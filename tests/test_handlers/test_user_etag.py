@@ -0,0 +1,97 @@
+import json
+from uuid import uuid4
+
+from db.models import UserRole
+from tests.conftest import create_test_auth_headers_for_user
+
+
+async def test_get_user_not_modified(client, create_user_in_database):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Aslaug",
+        "surname": "Sigurdsdottir",
+        "email": "aslaug_queen@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    resp = client.get(f'/user/?user_id={user_data["user_id"]}', headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] == '"1"'
+    resp = client.get(
+        f'/user/?user_id={user_data["user_id"]}',
+        headers={**headers, "If-None-Match": 'W/"1"'},
+    )
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == '"1"'
+    assert resp.content == b""
+
+
+async def test_update_user_if_match(
+    client, create_user_in_database, get_user_from_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Lagertha",
+        "surname": "Shieldmaiden",
+        "email": "lagertha_shield@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    resp = client.patch(
+        f'/user/?user_id={user_data["user_id"]}',
+        data=json.dumps({"surname": "Earl"}),
+        headers={**headers, "If-Match": '"1"'},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] == '"2"'
+    # a writer holding the old version loses the race
+    resp = client.patch(
+        f'/user/?user_id={user_data["user_id"]}',
+        data=json.dumps({"surname": "Queen"}),
+        headers={**headers, "If-Match": '"1"'},
+    )
+    assert resp.status_code == 412
+    users_from_db = await get_user_from_database(user_data["user_id"])
+    assert dict(users_from_db[0])["surname"] == "Earl"
+    assert dict(users_from_db[0])["version"] == 2
+    resp = client.get(
+        f'/user/?user_id={user_data["user_id"]}',
+        headers={**headers, "If-None-Match": '"1"'},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] == '"2"'
+
+
+async def test_delete_user_if_match(
+    client, create_user_in_database, get_user_from_database
+):
+    user_data = {
+        "user_id": uuid4(),
+        "name": "Floki",
+        "surname": "Boatbuilder",
+        "email": "floki_boats@clan.com",
+        "is_active": True,
+        "hashed_password": "Raven123",
+        "roles": [UserRole.ROLE_USER_SIMPLE],
+    }
+    await create_user_in_database(**user_data)
+    headers = create_test_auth_headers_for_user(user_data["email"])
+    resp = client.delete(
+        f'/user/?user_id={user_data["user_id"]}',
+        headers={**headers, "If-Match": '"7"'},
+    )
+    assert resp.status_code == 412
+    users_from_db = await get_user_from_database(user_data["user_id"])
+    assert dict(users_from_db[0])["is_active"] is True
+    resp = client.delete(
+        f'/user/?user_id={user_data["user_id"]}',
+        headers={**headers, "If-Match": '"1"'},
+    )
+    assert resp.status_code == 200
+    assert resp.json() == {"deleted_user_id": str(user_data["user_id"])}